@@ -3,10 +3,12 @@
 import asyncio
 import aiohttp
 import json
+import orjson # C JSON codec for request/response bodies
 import random
+import socket
+import sys
 import time
-import psutil # Although imported, psutil is not used in the provided code. Keep for consistency.
-from typing import List, Dict, Any, Optional, Union, Literal
+from typing import List, Dict, Any, Optional, Union, Literal, Callable
 import logging
 import re
 from pydantic import (
@@ -17,9 +19,11 @@ from pydantic import (
     field_validator,
     model_validator,
     ConfigDict,
+    PrivateAttr,
 )
 from ipaddress import ip_address, AddressValueError
 from urllib.parse import (
+    ParseResult,
     urlparse,
     urlunparse,
     quote,
@@ -27,25 +31,53 @@ from urllib.parse import (
     parse_qsl,
     urlencode,
 )
-from collections import deque
-import traceback
-import copy  # For deep copying the execution context in loops
-import math # Needed for is_number check (isNaN)
+from functools import lru_cache
+from types import MappingProxyType
+from aiohttp.abc import AbstractResolver
+import copy  # Fallback for non-JSON values in _fast_copy
 
 # Needed for the discriminated union fix
 from typing import Annotated
 
 # --- Logging Setup ---
+class _CachedUTCFormatter(logging.Formatter):
+    """
+    UTC formatter that renders the date/time part once per second and only
+    appends milliseconds per record. Output matches logging.Formatter with
+    converter=time.gmtime ('YYYY-mm-dd HH:MM:SS,mmm').
+    """
+    converter = time.gmtime
+    _cached_second = (-1, "") # (epoch second, rendered date/time), swapped as one tuple
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        sec = int(record.created)
+        cached_sec, cached_str = self._cached_second
+        if sec != cached_sec:
+            cached_str = time.strftime(self.default_time_format, time.gmtime(sec))
+            self._cached_second = (sec, cached_str)
+        return self.default_msec_format % (cached_str, record.msecs)
+
 logger = logging.getLogger("FlowRunner")
 if not logger.hasHandlers():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     # Using the "Z" suffix per your second version:
-    formatter = logging.Formatter('%(asctime)sZ - %(levelname)s - %(name)s - %(message)s')
-    formatter.converter = time.gmtime # Ensure UTC timestamps in formatter
+    formatter = _CachedUTCFormatter('%(asctime)sZ - %(levelname)s - %(name)s - %(message)s') # UTC timestamps
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
 logger.propagate = False # Prevent duplicate logs if root logger is configured
+# Mirrors logger.isEnabledFor(DEBUG). Per-request hot paths test this plain global
+# before building debug f-strings; elsewhere logger.debug is called unguarded. It is
+# refreshed by FlowRunner.configure_logging and at the start of every flow iteration,
+# so a host that calls logger.setLevel() itself sees debug lines from the next iteration.
+_DEBUG = False
+
+def _sync_debug_flag() -> None:
+    """Re-read _DEBUG from the logger's effective level."""
+    global _DEBUG
+    _DEBUG = logger.isEnabledFor(logging.DEBUG)
 
 # --- Exports for flow_container_control ---
 __all__ = [
@@ -59,6 +91,77 @@ __all__ = [
 # Forward reference for nested types (or use UpdateForwardRefs later)
 FlowStep = Any  # Placeholder for recursive type hint
 
+def _warm_templates(value: Any) -> None:
+    """Compile every {{...}} string and ##VAR token in value (recursing into dicts/lists) into their caches at load time."""
+    if isinstance(value, str):
+        if "{{" in value:
+            _compile_template(value)
+        elif value.startswith("##VAR:") and value.endswith("##"):
+            _parse_var_token(value)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            _warm_templates(k)
+            _warm_templates(v)
+    elif isinstance(value, list):
+        for item in value:
+            _warm_templates(item)
+
+def _intern_keys(mapping: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Return mapping with interned keys; header names and variable names are looked up per request."""
+    if not mapping:
+        return mapping
+    return {sys.intern(k): v for k, v in mapping.items()}
+
+def _json_dumps_bytes(value: Any) -> bytes:
+    """
+    Serialize value to compact UTF-8 JSON bytes with orjson, which writes
+    NaN/Infinity as null. Values orjson rejects fall back to json.dumps.
+    """
+    try:
+        return orjson.dumps(value)
+    except TypeError: # orjson.JSONEncodeError: non-str keys, ints beyond 64 bits, ...
+        return json.dumps(value).encode('utf-8')
+
+def _json_dumps_str(value: Any) -> str:
+    """json_serialize hook for aiohttp sessions (expects str)."""
+    return _json_dumps_bytes(value).decode('utf-8')
+
+def _json_loads(raw: Union[bytes, str]) -> Any:
+    """Parse JSON with orjson; falls back to json for inputs orjson rejects (e.g. NaN)."""
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw)
+
+def _has_template(value: Any) -> bool:
+    """True if value (or any nested key/item) would be changed by _substitute_variables."""
+    if isinstance(value, str):
+        if "{" not in value and "#" not in value:
+            return False
+        return "{{" in value or (value.startswith("##VAR:") and value.endswith("##"))
+    if isinstance(value, dict):
+        return any(_has_template(k) or _has_template(v) for k, v in value.items())
+    if isinstance(value, list):
+        return any(_has_template(item) for item in value)
+    return False
+
+def _compile_body_template(template: Any) -> Callable[[Callable[[str, Dict[str, Any]], Any], Dict[str, Any]], Any]:
+    """
+    Build a renderer for a request body template: render(substitute, context)
+    passes each templated string through substitute and shares template-free
+    subtrees as-is. The template is walked once here, so rendering does no
+    _has_template scans or type checks.
+    """
+    if not _has_template(template):
+        return lambda substitute, context: template
+    if isinstance(template, str):
+        return lambda substitute, context: substitute(template, context)
+    if isinstance(template, dict):
+        items = tuple((_compile_body_template(k), _compile_body_template(v)) for k, v in template.items())
+        return lambda substitute, context: {key(substitute, context): val(substitute, context) for key, val in items}
+    items = tuple(_compile_body_template(item) for item in template) # list
+    return lambda substitute, context: [item(substitute, context) for item in items]
+
 class BaseStep(BaseModel):
     id: str = Field(..., description="Unique identifier for the step")
     name: Optional[str] = Field(None, description="Human-readable name for the step")
@@ -73,13 +176,64 @@ class RequestStep(BaseStep):
     extract: Optional[Dict[str, str]] = Field(default_factory=dict, description="Mapping of variable names to extract from response using path notation (e.g., 'token': 'body.data.sessionToken', 'firstId': 'body.data.items[0].id', 'status_code': '.status', 'header_val': 'headers.Content-Type')") # Updated description with prefixes
     onFailure: Literal['stop', 'continue'] = Field(..., description="Action on request failure (status >= 300): 'stop' or 'continue'.") # Added onFailure field
 
+    # Precomputed once at validation; defaults are the safe "always substitute" path
+    _url_needs_substitution: bool = PrivateAttr(default=True)
+    _parsed_url: Optional[ParseResult] = PrivateAttr(default=None) # urlparse(url) for template-free URLs
+    _headers_need_substitution: bool = PrivateAttr(default=True)
+    _body_needs_substitution: bool = PrivateAttr(default=True)
+    _static_json_body: Optional[bytes] = PrivateAttr(default=None) # Pre-serialized template-free dict body
+    _body_renderer: Optional[Callable] = PrivateAttr(default=None) # _compile_body_template(body) for templated bodies
+    _trailing_url_param: Optional[str] = PrivateAttr(default=None) # {{param}} that ends the URL path, if any
+    # Interned context keys for this step's response_{id}_status/_headers/_body/_error
+    _status_key: str = PrivateAttr(default="")
+    _headers_key: str = PrivateAttr(default="")
+    _body_key: str = PrivateAttr(default="")
+    _error_key: str = PrivateAttr(default="")
+
+    # Steps are shared by every simulated user; per-user state lives in the context dict
+    model_config = ConfigDict(frozen=True)
+
     @field_validator('method')
     def validate_method(cls, v):
         allowed_methods = ['GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'PATCH', 'OPTIONS']
         method_upper = v.upper()
         if method_upper not in allowed_methods:
             raise ValueError(f"method must be one of {allowed_methods}, got '{v}'")
-        return method_upper
+        return sys.intern(method_upper)
+
+    @field_validator('headers', 'extract')
+    def intern_keys(cls, v):
+        return _intern_keys(v)
+
+    @model_validator(mode='after')
+    def precompute_templates(self) -> 'RequestStep':
+        context_prefix = f'response_{self.id}' # Prefix for storing response info
+        self._status_key = sys.intern(f'{context_prefix}_status')
+        self._headers_key = sys.intern(f'{context_prefix}_headers')
+        self._body_key = sys.intern(f'{context_prefix}_body')
+        self._error_key = sys.intern(f'{context_prefix}_error')
+        self._url_needs_substitution = _has_template(self.url)
+        if not self._url_needs_substitution:
+            try:
+                self._parsed_url = urlparse(self.url)
+            except ValueError:
+                pass # Left to the request builder, which reports it per request as before
+        self._headers_need_substitution = _has_template(self.headers)
+        self._body_needs_substitution = _has_template(self.body)
+        if isinstance(self.body, dict) and not self._body_needs_substitution:
+            self._static_json_body = _json_dumps_bytes(self.body)
+        _warm_templates(self.url)
+        url_stripped = self.url.rstrip('/')
+        for param in _VAR_RE.findall(self.url):
+            if url_stripped.endswith(f"{{{{{param}}}}}"):
+                self._trailing_url_param = param
+                break
+        if self._headers_need_substitution:
+            _warm_templates(self.headers)
+        if self._body_needs_substitution:
+            _warm_templates(self.body)
+            self._body_renderer = _compile_body_template(self.body)
+        return self
 
 class ConditionData(BaseModel):
     """
@@ -89,6 +243,34 @@ class ConditionData(BaseModel):
     operator: str = Field("", description="Operation to perform (e.g., 'equals', 'exists', 'is_number', 'greater_than')")
     value: Optional[str] = Field("", description="Value to compare against (for operators that need it)")
 
+    # Operands normalised once at validation; evaluation only reads these
+    _variable_path: str = PrivateAttr(default="")
+    _path_tokens: Optional[tuple] = PrivateAttr(default=None) # _compile_path(_variable_path)
+    _operator: str = PrivateAttr(default="")
+    _value_str: str = PrivateAttr(default="")
+    _numeric_value: Optional[Union[int, float]] = PrivateAttr(default=None) # value as int (or float), None if not numeric
+    _bool_value: Optional[bool] = PrivateAttr(default=None) # 'true'/'false' in any case, else None
+    _value_is_null: bool = PrivateAttr(default=False) # value spells null/None/empty
+
+    model_config = ConfigDict(frozen=True)
+
+    @model_validator(mode='after')
+    def precompute_operands(self) -> 'ConditionData':
+        self._variable_path = self.variable.strip()
+        self._path_tokens = _compile_path(self._variable_path)
+        self._operator = sys.intern(self.operator.strip()) # Same object as the _OPERATOR_DISPATCH key
+        value_str = self.value if self.value is not None else ""
+        self._value_str = value_str
+        try: self._numeric_value = int(value_str)
+        except (ValueError, TypeError):
+            try: self._numeric_value = float(value_str)
+            except (ValueError, TypeError): pass
+        val_str_lower = value_str.lower()
+        if val_str_lower == 'true': self._bool_value = True
+        elif val_str_lower == 'false': self._bool_value = False
+        self._value_is_null = val_str_lower in ('null', 'none', '')
+        return self
+
 class ConditionStep(BaseStep):
     type: Literal['condition'] = Field(..., description="Specifies the step type as 'condition'")
     condition: Optional[str] = Field(None, description="DEPRECATED/LEGACY: Original JavaScript-like condition string. Use conditionData instead.")
@@ -96,6 +278,8 @@ class ConditionStep(BaseStep):
     then: List["FlowStep"] = Field(default_factory=list, description="Steps to execute if condition is true")
     else_: Optional[List["FlowStep"]] = Field(default_factory=list, alias="else", description="Steps to execute if condition is false")
 
+    model_config = ConfigDict(frozen=True)
+
     # Validator to ensure at least one condition method is present
     @model_validator(mode='after')
     def check_condition_presence(self) -> 'ConditionStep':
@@ -123,6 +307,9 @@ class LoopStep(BaseStep):
     loopVariable: str = Field(..., description="Name for the variable representing each item in the loop (e.g., 'item')")
     steps: List["FlowStep"] = Field(default_factory=list, description="Steps to execute for each item in the loop")
 
+    # invariant: step subtree is immutable; iterations copy the context, never the steps (no model_copy)
+    model_config = ConfigDict(frozen=True)
+
 # ------------------------------------------------------------------
 # Make FlowStep a discriminated union using Annotated
 # ------------------------------------------------------------------
@@ -135,6 +322,13 @@ FlowStep = Annotated[
 ConditionStep.model_rebuild()
 LoopStep.model_rebuild()
 
+# 'type' discriminator -> concrete model, for validating raw step dicts at run time
+_STEP_MODELS = {
+    'request': RequestStep,
+    'condition': ConditionStep,
+    'loop': LoopStep,
+}
+
 class FlowMap(BaseModel):
     id: Optional[str | int] = Field(
         None,
@@ -149,8 +343,12 @@ class FlowMap(BaseModel):
     steps: List[FlowStep] = Field(..., description="The sequence of steps defining the flow")
     staticVars: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Global static variables accessible anywhere in the flow (referenced as {{varName}}). Values can be strings, numbers, booleans.") # Allow Any type
 
-    # Ignore any extra fields when parsing flow definitions
-    model_config = ConfigDict(extra="ignore")
+    # Ignore any extra fields when parsing flow definitions; the parsed flow is read-only
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    @field_validator('headers', 'staticVars')
+    def intern_keys(cls, v):
+        return _intern_keys(v)
 
 # Ensure FlowMap uses the updated FlowStep
 FlowMap.model_rebuild()
@@ -210,6 +408,10 @@ class ContainerConfig(BaseModel):
             return None # Treat empty string as None
         return v
 
+    @field_validator('xff_header_name')
+    def intern_xff_header_name(cls, v):
+        return sys.intern(v)
+
     @field_validator('flow_cycle_delay_ms')
     def validate_cycle_delay(cls, v):
         if v == "":
@@ -229,14 +431,21 @@ class StartRequest(BaseModel):
 # ---------------------------
 # Metrics Tracking
 # ---------------------------
+# RPS window: _RPS_BUCKETS slots of 1/_RPS_BUCKETS seconds each
+_RPS_BUCKETS = 10
+
 class Metrics:
     """
-    Tracks RPS using a rolling window and computes average flow duration.
-    Thread-safe using asyncio.Lock.
+    Tracks RPS using a ring of 100ms buckets and computes average flow duration.
+    Writers and readers all run on the single runner event loop and never
+    await mid-update, so no lock is needed on either side.
     """
     def __init__(self):
-        self.lock = asyncio.Lock()
-        self.request_timestamps = deque()
+        # Request counts per 100ms tick; _bucket_ticks records which tick each
+        # slot currently holds so stale slots are reset lazily on reuse.
+        self._buckets = [0] * _RPS_BUCKETS
+        self._bucket_ticks = [-1] * _RPS_BUCKETS
+        self.total_requests = 0
         self.last_rps_update_time = 0
         self.last_rps_value = 0.0 # Use float for consistency
 
@@ -244,77 +453,119 @@ class Metrics:
         self.flow_duration_sum = 0.0
         self.flow_count = 0
 
-    async def increment(self):
+    def increment(self):
         """Record that a request was made (for RPS)."""
-        now = time.monotonic()
-        async with self.lock:
-            self.request_timestamps.append(now)
-            # Optimization: Only prune when necessary (e.g., during get_rps) or periodically?
-            # For simplicity, prune here.
-            one_second_ago = now - 1.0
-            while self.request_timestamps and self.request_timestamps[0] < one_second_ago:
-                self.request_timestamps.popleft()
+        # Synchronous and lock-free: called on every request from the runner loop
+        tick = int(time.monotonic() * _RPS_BUCKETS)
+        slot = tick % _RPS_BUCKETS
+        if self._bucket_ticks[slot] == tick:
+            self._buckets[slot] += 1
+        else:
+            self._bucket_ticks[slot] = tick
+            self._buckets[slot] = 1
+        self.total_requests += 1
 
     async def get_rps(self) -> float:
         """Return the approximate RPS over the last 1 second."""
         now = time.monotonic()
-        # Cache result briefly to avoid excessive lock contention if called rapidly
+        # Cache result briefly if called rapidly
         if now - self.last_rps_update_time < 0.1:
             return self.last_rps_value
 
-        async with self.lock:
-            one_second_ago = now - 1.0
-            # Prune older timestamps
-            while self.request_timestamps and self.request_timestamps[0] < one_second_ago:
-                self.request_timestamps.popleft()
-            # Count remaining timestamps (within the last second)
-            current_rps = float(len(self.request_timestamps))
-            self.last_rps_value = current_rps
-            self.last_rps_update_time = now
-            return current_rps
+        tick = int(now * _RPS_BUCKETS)
+        current_rps = float(sum(
+            count for count, bucket_tick in zip(self._buckets, self._bucket_ticks)
+            if tick - bucket_tick < _RPS_BUCKETS
+        ))
+        self.last_rps_value = current_rps
+        self.last_rps_update_time = now
+        return current_rps
 
     async def record_flow_duration(self, duration_seconds: float):
         """Record the duration of a completed flow instance."""
         if duration_seconds < 0:
              logger.warning(f"Attempted to record negative flow duration: {duration_seconds:.3f}s. Ignoring.")
              return
-        async with self.lock:
-            self.flow_duration_sum += duration_seconds
-            self.flow_count += 1
+        # No await between the two updates, so no lock is needed on the loop
+        self.flow_duration_sum += duration_seconds
+        self.flow_count += 1
 
     async def get_average_flow_duration_ms(self) -> float:
         """Return the average duration of completed flows in milliseconds."""
-        async with self.lock:
-            if self.flow_count == 0:
-                return 0.0
-            # Ensure division by zero is not possible (already checked flow_count)
-            average_duration_s = self.flow_duration_sum / self.flow_count
-            return average_duration_s * 1000.0
+        # Sum and count are read together with no await in between
+        if self.flow_count == 0:
+            return 0.0
+        # Ensure division by zero is not possible (already checked flow_count)
+        average_duration_s = self.flow_duration_sum / self.flow_count
+        return average_duration_s * 1000.0
 
 # ---------------------------
 # Context Helper Functions
 # ---------------------------
 
-# Pre-compile regex for efficiency (slightly improved to handle keys starting with numbers, though less common)
-_context_path_regex = re.compile(r'\[(\d+)\]|([a-zA-Z_]\w*)|\.?([a-zA-Z_]\w*)')
-# Simpler Regex (original): Matches indices or sequences of non-dot/bracket characters
-# _context_path_regex = re.compile(r'$$(\d+)$$|([^.$$$$]+)')
-
 # --- Sentinel Object for Missing Keys ---
 _MISSING = object()
 
-def get_value_from_context(context: Dict[str, Any], key: str) -> Any:
+@lru_cache(maxsize=4096)
+def _compile_path(key: str) -> tuple:
+    """
+    Parse a context path such as 'data.values[0].id' into a tuple of
+    ('i', index, path_so_far) / ('k', name, path_so_far) tokens.
+    Paths come from the flow definition, so the cache saturates quickly and
+    lookups never touch the regex engine after the first iteration.
+    """
+    tokens = []
+    processed_path = "" # Path traversed so far, precomputed for log messages
+    # Hand-written scanner equivalent to finditer(r'\[(\d+)\]|\.?([^.\[\]]+)'):
+    # '[digits]' is an index, runs of other characters are key names, and any
+    # stray '.', '[' or ']' is skipped.
+    n = len(key)
+    i = 0
+    while i < n:
+        ch = key[i]
+        if ch == '[':
+            j = i + 1
+            while j < n and key[j].isdecimal():
+                j += 1
+            if j > i + 1 and j < n and key[j] == ']':
+                index_str = key[i + 1:j]
+                processed_path += f"[{index_str}]"
+                tokens.append(('i', int(index_str), processed_path))
+                i = j + 1
+            else:
+                i += 1
+        elif ch == '.' or ch == ']':
+            i += 1
+        else:
+            j = i + 1
+            while j < n and key[j] not in '.[]':
+                j += 1
+            part_name = key[i:j]
+            if processed_path and not processed_path.endswith(']'): # Add dot separator
+                processed_path += "."
+            processed_path += part_name
+            tokens.append(('k', sys.intern(part_name), processed_path))
+            i = j
+    return tuple(tokens)
+
+# Constant context paths checked on every step, tokenized once at import
+_FLOW_ERROR_PATH = _compile_path('flow_error')
+
+def get_value_from_context(context: Dict[str, Any], key: str, tokens: Optional[tuple] = None) -> Any:
     """
     Safely retrieve a value from a nested context dictionary using dot notation
     for keys and bracket notation for list indices (e.g., 'data.values[0].id').
     Uses a sentinel object to distinguish missing keys from None values.
     Returns the sentinel _MISSING if the path is invalid or the key is not found.
+    Callers that already hold _compile_path(key) can pass it as tokens.
     """
     if not key:
-        logger.debug("Attempted to get value from context with empty key.")
+        if _DEBUG:
+            logger.debug("Attempted to get value from context with empty key.")
         return _MISSING
     if not isinstance(context, (dict, list)):
-        logger.debug(f"Context is not a dictionary or list (type: {type(context).__name__}). Cannot retrieve path '{key}'.")
+        if _DEBUG:
+            logger.debug(f"Context is not a dictionary or list (type: {type(context).__name__}). Cannot retrieve path '{key}'.")
         # Special case: If context isn't dict/list, but key is simple (no . or []), maybe allow direct access?
         # For consistency with path traversal, let's return _MISSING unless context is dict/list.
         # This might need adjustment if accessing attributes of objects becomes necessary.
@@ -322,81 +573,69 @@ def get_value_from_context(context: Dict[str, Any], key: str) -> Any:
 
 
     current_value = context
-    # Use finditer to handle sequences like key[0].key[1] correctly
-    matches = list(re.finditer(r'\[(\d+)\]|\.?([^.\[\]]+)', key)) # Simplified regex for keys/indices
+    if tokens is None:
+        tokens = _compile_path(key)
     processed_path = "" # Keep track of the path traversed for logging
 
-    if not matches:
-         # If no matches from regex, assume it's a simple top-level key
+    if not tokens:
+         # If the path has no segments, assume it's a simple top-level key
          if isinstance(context, dict):
              # Use .get with sentinel for direct dictionary access
-             logger.debug(f"Retrieving top-level key '{key}' directly.")
+             if _DEBUG:
+                 logger.debug(f"Retrieving top-level key '{key}' directly.")
              return context.get(key, _MISSING)
          elif isinstance(context, list):
-              logger.debug(f"Cannot retrieve simple key '{key}' from a list context.")
+              if _DEBUG:
+                  logger.debug(f"Cannot retrieve simple key '{key}' from a list context.")
               return _MISSING
          else: # Should be unreachable due to initial check, but for safety
-              logger.debug(f"Path '{key}' did not match expected format and context is not dict.")
+              if _DEBUG:
+                  logger.debug(f"Path '{key}' did not match expected format and context is not dict.")
               return _MISSING
 
 
     try:
-        for match in matches:
-            index_str = match.group(1)
-            part_name = match.group(2)
-
-            if index_str is not None:
+        for kind, part, processed_path in tokens:
+            if kind == 'i':
                 # Handle list index access: [index]
-                processed_path += f"[{index_str}]"
-                try:
-                    index = int(index_str)
-                except ValueError:
-                    # This should not happen with the regex \d+, but safety first.
-                    logger.debug(f"Invalid non-integer index '{index_str}' in key '{key}' at path '{processed_path}'.")
-                    return _MISSING
-
                 if not isinstance(current_value, list):
-                    logger.debug(f"Attempted list index access on non-list type '{type(current_value).__name__}' for key '{key}' at path '{processed_path}'.")
+                    if _DEBUG:
+                        logger.debug(f"Attempted list index access on non-list type '{type(current_value).__name__}' for key '{key}' at path '{processed_path}'.")
                     return _MISSING
-                if 0 <= index < len(current_value):
-                    current_value = current_value[index]
+                if 0 <= part < len(current_value):
+                    current_value = current_value[part]
                 else:
-                    logger.debug(f"Index {index} out of bounds (length {len(current_value)}) for key '{key}' at path '{processed_path}'.")
+                    if _DEBUG:
+                        logger.debug(f"Index {part} out of bounds (length {len(current_value)}) for key '{key}' at path '{processed_path}'.")
                     return _MISSING
 
-            elif part_name is not None:
+            else:
                 # Handle dictionary key access: .key or key at start
-                original_part_name = part_name # Keep original for error messages
-                if processed_path and not processed_path.endswith(']'): # Add dot separator if not the first part or after index
-                    processed_path += "."
-                processed_path += part_name
-
                 # Attempt access using the sentinel
                 if isinstance(current_value, dict):
-                    current_value = current_value.get(part_name, _MISSING) # Use sentinel default
+                    current_value = current_value.get(part, _MISSING) # Use sentinel default
                     if current_value is _MISSING: # Key truly didn't exist
-                        # Do NOT log the debug message here, let the caller decide based on _MISSING return.
-                        # logger.debug(f"Key '{original_part_name}' not found in dictionary for key '{key}' at path '{processed_path}'.")
+                        # Do NOT log here, let the caller decide based on _MISSING return.
                         return _MISSING # Key truly missing, return sentinel
                     # else: Key existed, current_value is updated (could be None)
                 else:
                     # Path tried to access a key on something that wasn't a dict
-                    logger.debug(f"Attempted key access ('{original_part_name}') on non-dictionary type '{type(current_value).__name__}' for key '{key}' at path '{processed_path}'.")
+                    if _DEBUG:
+                        logger.debug(f"Attempted key access ('{part}') on non-dictionary type '{type(current_value).__name__}' for key '{key}' at path '{processed_path}'.")
                     return _MISSING
-            else:
-                 # This case should ideally not be reached with the current regex
-                 logger.warning(f"Unexpected regex match state for key '{key}' at path '{processed_path}'. Match groups: {match.groups()}")
-                 return _MISSING
 
         # If loop completes, current_value holds the final result (could be None or a valid value)
         return current_value
 
     except Exception as e:
         # Catch-all for any unexpected issues during traversal
-        logger.warning(f"Unexpected error accessing context key '{key}' at path '{processed_path}': {e}", exc_info=False) # Keep log brief
+        logger.warning(f"Unexpected error accessing context key '{key}' at path '{processed_path}': {type(e).__name__}: {str(e)[:200]}", exc_info=False) # Keep log brief
         return _MISSING
 
 
+# A top-level key with no path syntax
+_SIMPLE_KEY_RE = re.compile(r'^[^.\[\]]+$')
+
 def set_value_in_context(context: Dict[str, Any], key: str, value: Any):
     """
     Safely set a value in a nested context dictionary using dot and bracket notation,
@@ -412,11 +651,12 @@ def set_value_in_context(context: Dict[str, Any], key: str, value: Any):
         return
 
     target = context
-    # Use the same regex as get_value_from_context
-    matches = list(re.finditer(r'\[(\d+)\]|\.?([^.\[\]]+)', key))
-    if not matches: # Handle simple top-level key assignment
-         if re.match(r'^[^.\[\]]+$', key):# Ensure it's a simple key
-             logger.debug(f"Setting top-level key '{key}'.")
+    # Use the same cached path tokens as get_value_from_context
+    tokens = _compile_path(key)
+    if not tokens: # Handle simple top-level key assignment
+         if _SIMPLE_KEY_RE.match(key):# Ensure it's a simple key
+             if _DEBUG:
+                 logger.debug(f"Setting top-level key '{key}'.")
              context[key] = value
              return # Added return here for clarity
          else:
@@ -424,102 +664,398 @@ def set_value_in_context(context: Dict[str, Any], key: str, value: Any):
          return
 
     processed_path = ""
+    last_index = len(tokens) - 1
 
     try:
-        for i, match in enumerate(matches):
-            is_last_part = (i == len(matches) - 1)
-            index_str = match.group(1)
-            part_name = match.group(2)
+        for i, (kind, part, processed_path) in enumerate(tokens):
+            is_last_part = (i == last_index)
 
-            if index_str is not None:
+            if kind == 'i':
                 # List index access: [index]
-                processed_path += f"[{index_str}]"
-                try:
-                    index = int(index_str)
-                except ValueError:
-                    logger.error(f"Invalid index '{index_str}' in key '{key}' at path '{processed_path}'. Cannot set value.")
-                    return
-
                 if not isinstance(target, list):
-                    logger.error(f"Cannot set value at index [{index}]: target is not a list (type: {type(target).__name__}) for key '{key}' at path '{processed_path}'.")
+                    logger.error(f"Cannot set value at index [{part}]: target is not a list (type: {type(target).__name__}) for key '{key}' at path '{processed_path}'.")
                     return
 
-                if 0 <= index < len(target):
+                if 0 <= part < len(target):
                     if is_last_part:
-                        target[index] = value
-                        logger.debug(f"Successfully set value for key '{key}' at path '{processed_path}'.")
+                        target[part] = value
+                        if _DEBUG:
+                            logger.debug(f"Successfully set value for key '{key}' at path '{processed_path}'.")
                         return # Value set successfully
                     else:
                         # Move deeper into the list element for subsequent parts
-                        target = target[index]
+                        target = target[part]
                 else:
                     # Do not create/extend lists automatically, only allow setting existing indices
-                    logger.error(f"Index {index} out of bounds (length {len(target)}) for key '{key}' at path '{processed_path}'. Cannot set value.")
+                    logger.error(f"Index {part} out of bounds (length {len(target)}) for key '{key}' at path '{processed_path}'. Cannot set value.")
                     return
 
-            elif part_name is not None:
+            else:
                 # Dictionary key access: .key or key
-                original_part_name = part_name
-                if processed_path and not processed_path.endswith(']'): # Add dot separator
-                    processed_path += "."
-                processed_path += part_name
-
                 if is_last_part:
                     # Last part, set the value directly in the current dictionary target
                     if isinstance(target, dict):
-                        target[part_name] = value
-                        logger.debug(f"Successfully set value for key '{key}' at path '{processed_path}'.")
+                        target[part] = value
+                        if _DEBUG:
+                            logger.debug(f"Successfully set value for key '{key}' at path '{processed_path}'.")
                         return # Value set successfully
                     else:
-                         logger.error(f"Cannot set final key '{part_name}': target is not a dictionary (type: {type(target).__name__}) for key '{key}' at path '{processed_path}'.")
+                         logger.error(f"Cannot set final key '{part}': target is not a dictionary (type: {type(target).__name__}) for key '{key}' at path '{processed_path}'.")
                          return
                 else:
                     # Intermediate part, ensure it's a dict and traverse/create
                     if not isinstance(target, dict):
-                         logger.error(f"Cannot traverse path: '{part_name}' expected in a dictionary, but found type {type(target).__name__} for key '{key}' at path '{processed_path}'.")
+                         logger.error(f"Cannot traverse path: '{part}' expected in a dictionary, but found type {type(target).__name__} for key '{key}' at path '{processed_path}'.")
                          return
 
-                    # Determine if the *next* segment requires a list or dict based on its format
-                    next_match = matches[i+1]
-                    next_is_list_index = next_match.group(1) is not None
-                    # next_is_dict_key = next_match.group(2) is not None # We assume next is key if not index
+                    # Determine if the *next* segment requires a list or dict based on its kind
+                    next_is_list_index = tokens[i + 1][0] == 'i'
 
-                    next_value = target.get(part_name, _MISSING)
+                    next_value = target.get(part, _MISSING)
 
                     if next_value is _MISSING:
                         # Key doesn't exist, create the necessary structure
                         if next_is_list_index:
                              # Cannot automatically create lists. Path is invalid if list doesn't exist.
-                             logger.error(f"Path requires a list at intermediate key '{part_name}' for key '{key}', but the key does not exist. Cannot set value.")
+                             logger.error(f"Path requires a list at intermediate key '{part}' for key '{key}', but the key does not exist. Cannot set value.")
                              return
                         else: # Assume next part needs a dict
                              # Create a new dict for the intermediate key
-                             logger.debug(f"Creating nested dictionary for '{part_name}' in context key '{key}' at path '{processed_path}'")
-                             target[part_name] = {}
-                             target = target[part_name] # Traverse into the new dict
+                             if _DEBUG:
+                                 logger.debug(f"Creating nested dictionary for '{part}' in context key '{key}' at path '{processed_path}'")
+                             target[part] = {}
+                             target = target[part] # Traverse into the new dict
                     elif next_is_list_index and not isinstance(next_value, list):
                         # Key exists, but next part needs a list, and it's not a list
-                        logger.error(f"Path requires a list at intermediate key '{part_name}' for key '{key}', but found type {type(next_value).__name__}. Cannot set value.")
+                        logger.error(f"Path requires a list at intermediate key '{part}' for key '{key}', but found type {type(next_value).__name__}. Cannot set value.")
                         return
                     elif not next_is_list_index and not isinstance(next_value, dict):
                          # Key exists, but next part needs a dict, and it's not a dict
-                         logger.error(f"Path requires a dictionary at intermediate key '{part_name}' for key '{key}', but found type {type(next_value).__name__}. Cannot set value.")
+                         logger.error(f"Path requires a dictionary at intermediate key '{part}' for key '{key}', but found type {type(next_value).__name__}. Cannot set value.")
                          return
                     else:
                          # Key exists and has the correct type (or it's the last part where type doesn't matter for traversal)
                          target = next_value # Traverse deeper
 
-
-            else:
-                 logger.error(f"Unexpected regex match state while setting key '{key}' at path '{processed_path}'.")
-                 return
-
     except Exception as e:
         # Use self.config if available, otherwise assume False for debug logging here
         # Note: 'self' is not directly available in this static function context.
         # We might need to pass the debug flag if detailed exc_info is needed here.
         # For now, keep exc_info=False for brevity in production.
-        logger.error(f"Unexpected error setting context key '{key}' at path '{processed_path}': {e}", exc_info=False)
+        logger.error(f"Unexpected error setting context key '{key}' at path '{processed_path}': {type(e).__name__}: {str(e)[:200]}", exc_info=False)
+
+
+# {{variable.or[0].path}} placeholder (non-greedy match inside braces)
+_VAR_RE = re.compile(r"\{\{([\w\.\[\]]+?)\}\}")
+# ##VAR:type:path## body token; type stops at the first ':', path may contain ':'
+_VAR_TOKEN_RE = re.compile(r"##VAR:([^:]*):(.*)##", re.DOTALL)
+# Legacy condition string: operand, optional operator and right operand.
+# WARNING: This is fragile. Structured conditions are strongly preferred.
+_LEGACY_CONDITION_RE = re.compile(r"""^\s*  # Start of string, optional whitespace
+               (.*?)\s*   # Left operand (non-greedy)
+               (?:(===|==|!==|!=|>|<|>=|<=)\s*(.*?))?  # Optional: Operator and Right operand
+               \s*$       # End of string, optional whitespace""", re.VERBOSE | re.DOTALL)
+
+# Query strings that parse_qsl + urlencode(quote_via=quote) reproduce exactly:
+# '&'-separated key=value pairs made only of unreserved characters
+_CANONICAL_QUERY_RE = re.compile(r"[A-Za-z0-9_.~-]+=[A-Za-z0-9_.~-]*(?:&[A-Za-z0-9_.~-]+=[A-Za-z0-9_.~-]*)*")
+
+@lru_cache(maxsize=256)
+def _compile_user_regex(pattern: str) -> re.Pattern:
+    """Compile a matches_regex pattern from the flow definition; raises re.error if invalid (failures are not cached)."""
+    return re.compile(pattern)
+
+@lru_cache(maxsize=4096)
+def _parse_var_token(token: str) -> Optional[tuple]:
+    """(type, path, path_tokens) for a ##VAR:type:path## token, or None if malformed. Tokens come from the flow definition."""
+    match = _VAR_TOKEN_RE.fullmatch(token)
+    if match is None:
+        return None
+    var_type, var_path = match.groups()
+    return var_type, var_path, _compile_path(var_path)
+
+@lru_cache(maxsize=4096)
+def _compile_template(template: str) -> Optional[tuple]:
+    """
+    Split a string into (literal, var_path, path_tokens) segments around its
+    {{...}} placeholders, with each path pre-tokenized by _compile_path; the
+    final segment carries the trailing literal and None path/tokens. Returns
+    None when the string has no placeholders. Templates come from the flow
+    definition, so each is scanned once.
+    """
+    if "{{" not in template:
+        return None # Literal: skip the regex scan entirely
+    segments = []
+    last_end = 0
+    for match in _VAR_RE.finditer(template):
+        start, end = match.span()
+        var_path = match.group(1).strip()
+        segments.append((template[last_end:start], var_path, _compile_path(var_path)))
+        last_end = end
+    if not segments:
+        return None
+    segments.append((template[last_end:], None, None))
+    return tuple(segments)
+
+_IMMUTABLE_SCALARS = (str, int, float, bool, type(None))
+
+@lru_cache(maxsize=32)
+def _override_address_family(ip: str) -> socket.AddressFamily:
+    """Validate a DNS override IP and return its address family; parsed once per distinct IP."""
+    return socket.AF_INET6 if ip_address(ip).version == 6 else socket.AF_INET
+
+class StaticResolver(AbstractResolver):
+    """
+    aiohttp resolver for flow_target_dns_override: answers the target hostname
+    with the override IP without any DNS query or getaddrinfo call. Other
+    hostnames go to aiohttp's default resolver, created on first use.
+    """
+
+    def __init__(self, host: str, ip: str) -> None:
+        self._host = host
+        self._ip = ip
+        self._family = _override_address_family(ip)
+        self._fallback: Optional[aiohttp.DefaultResolver] = None
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET) -> List[Dict[str, Any]]:
+        if host == self._host:
+            return [{
+                'hostname': host, 'host': self._ip, 'port': port,
+                'family': self._family, 'proto': 0, 'flags': socket.AI_NUMERICHOST,
+            }]
+        if self._fallback is None:
+            self._fallback = aiohttp.DefaultResolver()
+        return await self._fallback.resolve(host, port, family)
+
+    async def close(self) -> None:
+        if self._fallback is not None:
+            await self._fallback.close()
+
+# --- Per-flow header profiles and user agents ---
+# Built once at import and shared by every FlowRunner; header profiles are read-only
+# views, copied with dict() when a user starts a flow iteration.
+_USER_AGENTS_WEB = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 12_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.6 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0",
+    "Mozilla/5.0 (iPad; CPU OS 15_5 like Mac OS X) AppleWebKit/606.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/605.1.15",
+    "Mozilla/5.0 (Android 12; Mobile; rv:102.0) Gecko/102.0 Firefox/102.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/606.1.15 (KHTML, like Gecko) Version/15.6 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv=109.0) Gecko/20100101 Firefox/115.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13.5; rv=109.0) Gecko/20100101 Firefox/115.0",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv=109.0) Gecko/20100101 Firefox/115.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36 Edg/116.0.1938.69",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
+    "Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Mobile Safari/537.36",
+)
+_USER_AGENTS_API = (
+    "PostmanRuntime/7.29.0",
+    "Python-requests/2.27.1",
+    "curl/7.79.1",
+    "Go-http-client/1.1",
+    "Wget/1.20.3 (linux-gnu)",
+    "Apache-HttpClient/4.5.13 (Java/11.0.15)",
+    "axios/0.21.1 Node.js/v14.17.0",
+    "Java/1.8.0_281",
+    "libwww-perl/6.31",
+    "HTTPie/2.5.0",
+    "okhttp/4.9.1",
+    "Faraday v2.7.10",
+    "Dart/2.17 (dart:io)",
+    "Xamarin/3.0.0 (Xamarin.Android; Android 13; SDK 33)",
+    "Insomnia/2023.5.8",
+    "Nodejs-v16.16.0",
+    "Dalvik/2.1.0 (Linux; U; Android 13; SM-S918B Build/TP1A.220624.014)",
+    "aws-sdk-js-2.1395.0",
+    "Swift-URLSession",
+    "ruby rest-client/2.1.0",
+)
+_HEADERS_WEB = tuple(MappingProxyType(headers) for headers in (
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "en-US,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "DNT": "1"},
+    {"Accept": "application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "en-GB,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "DNT": "1", "Sec-Fetch-Site": "none", "Sec-Fetch-Mode": "navigate"},
+    {"Accept": "text/html,application/xhtml+xml", "Accept-Language": "fr-FR,fr;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Cache-Control": "no-cache"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "de-DE,de;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache", "Sec-Fetch-User": "?1"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "es-ES,es;q=0.5", "Connection": "keep-alive", "DNT": "1", "Sec-Fetch-Site": "cross-site"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "it-IT,it;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Cache-Control": "max-age=0"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "ja-JP,ja;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "ko-KR,ko;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Sec-Fetch-Dest": "document"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "zh-CN,zh;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache"},
+    {"Accept": "application/xhtml+xml,application/xml,*/*;q=0.8", "Accept-Language": "ru-RU,ru;q=0.5", "Connection": "keep-alive", "DNT": "1"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "en-AU,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Sec-Fetch-Mode": "navigate"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "en-CA,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
+    {"Accept": "application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "en-IE,en;q=0.5", "Connection": "keep-alive", "Sec-Fetch-Site": "none", "Cache-Control": "max-age=0"},
+    {"Accept": "text/html,application/xhtml+xml", "Accept-Language": "sv-SE,sv;q=0.5", "Connection": "keep-alive", "DNT": "1", "Sec-Fetch-Dest": "document"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "pt-PT,pt;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache", "Sec-Fetch-Mode": "navigate"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "nl-NL,nl;q=0.5", "Connection": "keep-alive", "Sec-Fetch-Site": "same-origin"},
+    {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "pl-PL,pl;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
+    {"Accept": "application/json", "Accept-Language": "en-US,en;q=0.5", "Connection": "keep-alive", "X-Requested-With": "XMLHttpRequest"},
+))
+_HEADERS_API = tuple(MappingProxyType(headers) for headers in (
+    {"Accept": "application/json", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "DNT": "1", "Cache-Control": "no-cache", "Pragma": "no-cache"},
+    {"Accept": "application/xml", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "DNT": "1", "X-Requested-With": "XMLHttpRequest"},
+    {"Accept": "*/*", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "Cache-Control": "no-cache", "X-Forwarded-Proto": "https"},
+    {"Accept": "application/json, text/plain, */*", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "X-Real-IP": "192.0.2.123"},
+    {"Accept": "application/json", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "User-Token": "randomtoken123456", "Forwarded": "for=198.51.100.50;proto=https"},
+    {"Accept": "application/json", "Connection": "keep-alive", "Accept-Language": "en-US,en;q=0.5", "X-Trace-ID": "trace-56789", "X-Device-ID": "device-98765"},
+    {"Accept": "application/vnd.api+json", "Connection": "keep-alive", "Authorization": "Bearer random_api_token", "X-API-Version": "2.0", "Accept-Encoding": "gzip, deflate, br"},
+    {"Accept": "application/ld+json", "Connection": "keep-alive", "X-Correlation-ID": "some_correlation_id", "Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "text/csv", "Connection": "keep-alive", "X-Auth-Token": "some_auth_token", "Accept-Encoding": "gzip, deflate, br", "Content-Type": "text/csv"},
+    {"Accept": "application/x-www-form-urlencoded", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "X-Client-Version": "1.1.3", "Content-Type": "application/x-www-form-urlencoded"},
+    {"Accept": "application/protobuf", "Connection": "keep-alive", "Content-Type": "application/protobuf", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "application/octet-stream", "Connection": "keep-alive", "Content-Type": "application/octet-stream", "Accept-Encoding": "gzip, deflate, br"},
+    {"Accept": "application/graphql", "Connection": "keep-alive", "Content-Type": "application/graphql", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "text/plain", "Connection": "keep-alive", "Content-Type": "text/plain", "Accept-Encoding": "gzip, deflate, br"},
+    {"Accept": "application/jwt", "Connection": "keep-alive", "Authorization": "Bearer some_jwt_token", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "application/vnd.ms-excel", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "Content-Type": "application/vnd.ms-excel"},
+    {"Accept": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    {"Accept": "image/png", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "image/jpeg", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br"},
+    {"Accept": "image/gif", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"},
+    {"Accept": "application/pdf", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br"},
+))
+
+# Inter-step sleep durations drawn per batch; one random.choices call instead of a randint per step
+_STEP_SLEEP_BATCH = 256
+
+def _fast_copy(value: Any) -> Any:
+    """
+    Deep copy for JSON-shaped data (dicts, lists and scalars), which is all a
+    flow context normally holds. Skips deepcopy's memo table and per-object
+    dispatch; anything else still goes through copy.deepcopy.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {k: _fast_copy(v) for k, v in value.items()}
+    if value_type is list:
+        return [_fast_copy(v) for v in value]
+    if value_type in _IMMUTABLE_SCALARS:
+        return value
+    return copy.deepcopy(value)
+
+
+# ---------------------------
+# Structured Condition Operators
+# ---------------------------
+# Each handler takes the context value (None when missing) and the validated
+# ConditionData, whose comparison value is pre-coerced by precompute_operands.
+# Type checks use exact types: context values are JSON-decoded, never subclasses,
+# and type(True) is bool keeps booleans out of _NUMTYPES.
+_NUMTYPES = frozenset((int, float))
+
+def _is_number(left_value: Any, condition_data: ConditionData) -> bool:
+    # Exclude bools and NaN floats (NaN is the only value unequal to itself)
+    value_type = type(left_value)
+    return value_type in _NUMTYPES and not (value_type is float and left_value != left_value)
+
+def _coerce_numeric(condition_data: ConditionData) -> Any:
+    # value_str as a number (int first, then float)
+    if condition_data._numeric_value is None:
+        return _MISSING
+    if _DEBUG:
+        logger.debug(f"Coerced comparison value '{condition_data._value_str}' to numeric type {type(condition_data._numeric_value).__name__}")
+    return condition_data._numeric_value
+
+def _coerce_bool(condition_data: ConditionData) -> Any:
+    # value_str as boolean ('true'/'false')
+    return _MISSING if condition_data._bool_value is None else condition_data._bool_value
+
+# Exact context-value type -> coercion of the (pre-parsed) comparison value.
+# String/List/Dict comparisons use value_str directly, so have no entry.
+_COERCERS: Dict[type, Callable[[ConditionData], Any]] = {
+    int: _coerce_numeric,
+    float: _coerce_numeric,
+    bool: _coerce_bool,
+}
+
+def _coerce_comparison_value(left_value: Any, condition_data: ConditionData) -> Any:
+    """The comparison value coerced towards left_value's type, or _MISSING if it does not coerce."""
+    coercer = _COERCERS.get(type(left_value))
+    return _MISSING if coercer is None else coercer(condition_data)
+
+def _equals(left_value: Any, condition_data: ConditionData) -> bool:
+    coerced_right = _coerce_comparison_value(left_value, condition_data)
+    # 1. Try comparing with coerced type if successful
+    if coerced_right is not _MISSING and type(left_value) is type(coerced_right):
+        return left_value == coerced_right
+    # 2. Fallback: Compare string representations (useful for int 200 vs str "200")
+    #    Only scalars are stringified (never lists/dicts); strings compare as they are.
+    left_type = type(left_value)
+    if left_type is str:
+        return left_value == condition_data._value_str
+    if left_type in _IMMUTABLE_SCALARS:
+        return str(left_value) == condition_data._value_str
+    # 3. Final check for None equality if left_value is None
+    if left_value is None:
+        return condition_data._value_is_null
+    return False # Mismatched types where coercion/string comp doesn't apply
+
+def _not_equals(left_value: Any, condition_data: ConditionData) -> bool:
+    # Similar logic to equals, but inverted
+    coerced_right = _coerce_comparison_value(left_value, condition_data)
+    if coerced_right is not _MISSING and type(left_value) is type(coerced_right):
+        return left_value != coerced_right
+    left_type = type(left_value)
+    if left_type is str:
+        return left_value != condition_data._value_str
+    if left_type in _IMMUTABLE_SCALARS:
+        return str(left_value) != condition_data._value_str
+    if left_value is None:
+        return not condition_data._value_is_null
+    return True # Mismatched types
+
+def _numeric_comparison(operator: str, compare: Callable[[Any, Any], bool]) -> Callable[[Any, ConditionData], bool]:
+    """Handler for an ordering operator; requires a numeric context value and comparison value."""
+    def handler(left_value: Any, condition_data: ConditionData) -> bool:
+        if type(left_value) in _NUMTYPES and condition_data._numeric_value is not None:
+            return compare(left_value, condition_data._numeric_value)
+        logger.warning(f"Cannot perform numeric comparison '{operator}' because context value ({type(left_value).__name__}) or comparison value ('{condition_data._value_str}') is not a compatible number.")
+        return False # Comparison fails if types aren't numeric
+    return handler
+
+def _contains(left_value: Any, condition_data: ConditionData) -> bool:
+    value_str = condition_data._value_str
+    if isinstance(left_value, str):
+        return value_str in left_value
+    if isinstance(left_value, (list, dict)):
+        return value_str in left_value # List element, or dict key
+    return False # Cannot perform contains on numbers, bools, None
+
+def _matches_regex(left_value: Any, condition_data: ConditionData) -> bool:
+    value_str = condition_data._value_str
+    if not (isinstance(left_value, str) and value_str):
+        return False # Regex only applicable to strings
+    try:
+        return _compile_user_regex(value_str).search(left_value) is not None
+    except re.error as e:
+        logger.error(f"Invalid regex pattern '{value_str}' in condition: {e}")
+        return False
+
+_OPERATOR_DISPATCH: Dict[str, Callable[[Any, ConditionData], bool]] = {
+    # --- Existence Checks (missing variables arrive as None) ---
+    'exists': lambda left_value, condition_data: left_value is not None, # JS `!= null`
+    'not_exists': lambda left_value, condition_data: left_value is None, # JS `== null`
+    # --- Type Checks ---
+    'is_number': _is_number,
+    'is_text': lambda left_value, condition_data: type(left_value) is str,
+    'is_boolean': lambda left_value, condition_data: type(left_value) is bool,
+    'is_array': lambda left_value, condition_data: type(left_value) is list, # Python list corresponds to JS array
+    # --- Boolean Value Checks (strict) ---
+    'is_true': lambda left_value, condition_data: left_value is True,
+    'is_false': lambda left_value, condition_data: left_value is False,
+    # --- Operators Requiring Comparison Value ---
+    'equals': _equals,
+    'not_equals': _not_equals,
+    'greater_than': _numeric_comparison('greater_than', lambda a, b: a > b),
+    'less_than': _numeric_comparison('less_than', lambda a, b: a < b),
+    'greater_equals': _numeric_comparison('greater_equals', lambda a, b: a >= b),
+    'less_equals': _numeric_comparison('less_equals', lambda a, b: a <= b),
+    'contains': _contains,
+    'starts_with': lambda left_value, condition_data: isinstance(left_value, str) and left_value.startswith(condition_data._value_str),
+    'ends_with': lambda left_value, condition_data: isinstance(left_value, str) and left_value.endswith(condition_data._value_str),
+    'matches_regex': _matches_regex,
+}
 
 
 # ---------------------------
@@ -530,6 +1066,21 @@ from typing import Callable
 
 class FlowRunner:
     """Executes flows continuously using asynchronous HTTP requests."""
+    # Every attribute set in __init__ lives in a slot. '__dict__' is kept so
+    # methods can still be overridden per instance (tests patch them).
+    __slots__ = (
+        'config', 'flowmap', 'metrics', 'on_iteration_start', 'run_once',
+        'running', 'user_tasks', 'lock', '_active_users_count', '_stopped_event',
+        '_validated_steps', '_shared_connector',
+        'user_agents_web', 'user_agents_api', '_ua_index_web', '_ua_index_api',
+        'headers_web_options', 'headers_api_options',
+        '_step_sleep_range_ms', '_step_sleeps_s', '_step_sleep_index', '_cycle_delay_s',
+        'parsed_url', 'original_host', 'original_scheme', 'default_port', 'target_ip',
+        '_connector_ssl', '_connector_limit', '_connector_limit_per_host',
+        '_override_port', '_override_netloc',
+        '__dict__',
+    )
+
     def __init__(
         self,
         config: ContainerConfig,
@@ -548,101 +1099,44 @@ class FlowRunner:
         # _active_users_count tracks actively running simulate_user_lifecycle coroutines
         self._active_users_count = 0
         self.lock = asyncio.Lock()  # Lock for managing user_tasks and _active_users_count
+        # One connection pool shared by all user tasks of a run (created in start_generating)
+        self._shared_connector: Optional[aiohttp.BaseConnector] = None
+        # Dict steps validated on first use, keyed by id(dict) -> (dict, model).
+        # The flow definition does not change during a run, so validate once.
+        self._validated_steps: Dict[int, tuple] = {}
         self.on_iteration_start = on_iteration_start
         self.run_once = run_once
 
         self.configure_logging(self.config.debug)
 
-        # --- Header/User-Agent Setup (Restored actual lists) ---
-        self.user_agents_web = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 12_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.6 Safari/605.1.15",
-            "Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0",
-            "Mozilla/5.0 (iPad; CPU OS 15_5 like Mac OS X) AppleWebKit/606.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/605.1.15",
-            "Mozilla/5.0 (Android 12; Mobile; rv:102.0) Gecko/102.0 Firefox/102.0",
-            "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/606.1.15 (KHTML, like Gecko) Version/15.6 Mobile/15E148 Safari/604.1",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv=109.0) Gecko/20100101 Firefox/115.0",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 13.5; rv=109.0) Gecko/20100101 Firefox/115.0",
-            "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv=109.0) Gecko/20100101 Firefox/115.0",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36 Edg/116.0.1938.69",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
-            "Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Mobile Safari/537.36"
-        ]
-        self.user_agents_api = [
-            "PostmanRuntime/7.29.0",
-            "Python-requests/2.27.1",
-            "curl/7.79.1",
-            "Go-http-client/1.1",
-            "Wget/1.20.3 (linux-gnu)",
-            "Apache-HttpClient/4.5.13 (Java/11.0.15)",
-            "axios/0.21.1 Node.js/v14.17.0",
-            "Java/1.8.0_281",
-            "libwww-perl/6.31",
-            "HTTPie/2.5.0",
-            "okhttp/4.9.1",
-            "Faraday v2.7.10",
-            "Dart/2.17 (dart:io)",
-            "Xamarin/3.0.0 (Xamarin.Android; Android 13; SDK 33)",
-            "Insomnia/2023.5.8",
-            "Nodejs-v16.16.0",
-            "Dalvik/2.1.0 (Linux; U; Android 13; SM-S918B Build/TP1A.220624.014)",
-            "aws-sdk-js-2.1395.0",
-            "Swift-URLSession",
-            "ruby rest-client/2.1.0"
-        ]
-        self.headers_web_options = [
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "en-US,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "DNT": "1"},
-            {"Accept": "application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "en-GB,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "DNT": "1", "Sec-Fetch-Site": "none", "Sec-Fetch-Mode": "navigate"},
-            {"Accept": "text/html,application/xhtml+xml", "Accept-Language": "fr-FR,fr;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Cache-Control": "no-cache"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "de-DE,de;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache", "Sec-Fetch-User": "?1"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "es-ES,es;q=0.5", "Connection": "keep-alive", "DNT": "1", "Sec-Fetch-Site": "cross-site"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "it-IT,it;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Cache-Control": "max-age=0"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "ja-JP,ja;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "ko-KR,ko;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Sec-Fetch-Dest": "document"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "zh-CN,zh;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache"},
-            {"Accept": "application/xhtml+xml,application/xml,*/*;q=0.8", "Accept-Language": "ru-RU,ru;q=0.5", "Connection": "keep-alive", "DNT": "1"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "en-AU,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1", "Sec-Fetch-Mode": "navigate"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "en-CA,en;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
-            {"Accept": "application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8", "Accept-Language": "en-IE,en;q=0.5", "Connection": "keep-alive", "Sec-Fetch-Site": "none", "Cache-Control": "max-age=0"},
-            {"Accept": "text/html,application/xhtml+xml", "Accept-Language": "sv-SE,sv;q=0.5", "Connection": "keep-alive", "DNT": "1", "Sec-Fetch-Dest": "document"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "pt-PT,pt;q=0.5", "Connection": "keep-alive", "Pragma": "no-cache", "Sec-Fetch-Mode": "navigate"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", "Accept-Language": "nl-NL,nl;q=0.5", "Connection": "keep-alive", "Sec-Fetch-Site": "same-origin"},
-            {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9", "Accept-Language": "pl-PL,pl;q=0.5", "Connection": "keep-alive", "Upgrade-Insecure-Requests": "1"},
-            {"Accept": "application/json", "Accept-Language": "en-US,en;q=0.5", "Connection": "keep-alive", "X-Requested-With": "XMLHttpRequest"}
-        ]
-        self.headers_api_options = [
-            {"Accept": "application/json", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "DNT": "1", "Cache-Control": "no-cache", "Pragma": "no-cache"},
-            {"Accept": "application/xml", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "DNT": "1", "X-Requested-With": "XMLHttpRequest"},
-            {"Accept": "*/*", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "Cache-Control": "no-cache", "X-Forwarded-Proto": "https"},
-            {"Accept": "application/json, text/plain, */*", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "X-Real-IP": "192.0.2.123"},
-            {"Accept": "application/json", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "User-Token": "randomtoken123456", "Forwarded": "for=198.51.100.50;proto=https"},
-            {"Accept": "application/json", "Connection": "keep-alive", "Accept-Language": "en-US,en;q=0.5", "X-Trace-ID": "trace-56789", "X-Device-ID": "device-98765"},
-            {"Accept": "application/vnd.api+json", "Connection": "keep-alive", "Authorization": "Bearer random_api_token", "X-API-Version": "2.0", "Accept-Encoding": "gzip, deflate, br"},
-            {"Accept": "application/ld+json", "Connection": "keep-alive", "X-Correlation-ID": "some_correlation_id", "Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "text/csv", "Connection": "keep-alive", "X-Auth-Token": "some_auth_token", "Accept-Encoding": "gzip, deflate, br", "Content-Type": "text/csv"},
-            {"Accept": "application/x-www-form-urlencoded", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "X-Client-Version": "1.1.3", "Content-Type": "application/x-www-form-urlencoded"},
-            {"Accept": "application/protobuf", "Connection": "keep-alive", "Content-Type": "application/protobuf", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "application/octet-stream", "Connection": "keep-alive", "Content-Type": "application/octet-stream", "Accept-Encoding": "gzip, deflate, br"},
-            {"Accept": "application/graphql", "Connection": "keep-alive", "Content-Type": "application/graphql", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "text/plain", "Connection": "keep-alive", "Content-Type": "text/plain", "Accept-Encoding": "gzip, deflate, br"},
-            {"Accept": "application/jwt", "Connection": "keep-alive", "Authorization": "Bearer some_jwt_token", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "application/vnd.ms-excel", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br", "Content-Type": "application/vnd.ms-excel"},
-            {"Accept": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate", "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
-            {"Accept": "image/png", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "image/jpeg", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br"},
-            {"Accept": "image/gif", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"},
-            {"Accept": "application/pdf", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate, br"}
-        ]
+        # --- Header/User-Agent Setup (module-level profiles) ---
+        # Shuffle once, then rotate: every user task runs on this loop, so a plain index suffices
+        self.user_agents_web = tuple(random.sample(_USER_AGENTS_WEB, len(_USER_AGENTS_WEB)))
+        self.user_agents_api = tuple(random.sample(_USER_AGENTS_API, len(_USER_AGENTS_API)))
+        self.headers_web_options = _HEADERS_WEB
+        self.headers_api_options = _HEADERS_API
+        self._ua_index_web = 0
+        self._ua_index_api = 0
         # --- End of Header/User-Agent Setup ---
 
+        # --- Sleep Setup ---
+        # Inter-step sleeps are drawn _STEP_SLEEP_BATCH at a time (see _next_step_sleep_s)
+        self._step_sleep_range_ms = range(self.config.min_sleep_ms, self.config.max_sleep_ms + 1)
+        self._step_sleeps_s: List[float] = []
+        self._step_sleep_index = 0
+        # Fixed inter-flow delay resolved once; None means a random min/max rest per iteration
+        self._cycle_delay_s: Optional[float] = (
+            max(self.config.flow_cycle_delay_ms / 1000.0, 0.001)
+            if self.config.flow_cycle_delay_ms is not None else None
+        )
+
 
         # --- URL Parsing & DNS Override Setup ---
         try:
             self.parsed_url = urlparse(self.config.flow_target_url)
             if not self.parsed_url.scheme or not self.parsed_url.netloc:
                  raise ValueError("flow_target_url must be an absolute URL (e.g., 'http://example.com')")
+            target_port = self.parsed_url.port # Raises ValueError for a malformed port
         except Exception as e:
              logger.critical(f"Invalid flow_target_url: {self.config.flow_target_url}. Error: {e}")
              # Handle fatal configuration error - maybe raise exception?
@@ -652,20 +1146,64 @@ class FlowRunner:
         self.original_scheme = self.parsed_url.scheme
         self.default_port = 443 if self.original_scheme == 'https' else 80
         self.target_ip = self.config.flow_target_dns_override # Already validated by Pydantic
+        # --- Connector Settings ---
+        # Fixed for the runner's lifetime; create_aiohttp_connector only instantiates.
+        # Determine SSL context based on target scheme
+        # Use None for default SSL context (recommended), False to disable SSL checks (use with caution)
+        self._connector_ssl = None if self.original_scheme == 'https' else False
+        # limit_per_host: Max connections per host pooled by this connector instance.
+        # limit: Total max connections pooled by this connector instance.
+        # Increase limits if many users hit the same target simultaneously.
+        self._connector_limit = max(100, self.config.sim_users * 2) # Example: allow more connections
+        self._connector_limit_per_host = max(50, self.config.sim_users) # Example: allow more per host
+
+        # Derived once; reused by the connector and every request rewritten to the override IP
+        self._override_port = target_port or self.default_port
+        self._override_netloc: Optional[str] = None
+        if self.target_ip:
+            ip_part = f"[{self.target_ip}]" if ':' in self.target_ip else self.target_ip
+            self._override_netloc = (
+                f"{ip_part}:{self._override_port}" if (self.original_scheme == 'https' and self._override_port != 443) or (self.original_scheme == 'http' and self._override_port != 80) else ip_part
+            )
 
         logger.info(f"Flow Runner Initialized: Target='{self.config.flow_target_url}', Target Sim Users={self.config.sim_users}, DNS Override={self.target_ip or 'None'}, Debug={self.config.debug}")
         flow_name = getattr(self.flowmap, 'name', 'N/A')
         num_steps = len(self.flowmap.steps) if self.flowmap and self.flowmap.steps else 0
         logger.info(f"Flow Loaded: {flow_name} ({num_steps} top-level steps)")
 
+    def _next_user_agent(self, web: bool) -> str:
+        """Return the next user agent from the pre-shuffled web or API list."""
+        if web:
+            agents = self.user_agents_web
+            index = self._ua_index_web
+            self._ua_index_web = (index + 1) % len(agents)
+        else:
+            agents = self.user_agents_api
+            index = self._ua_index_api
+            self._ua_index_api = (index + 1) % len(agents)
+        return agents[index]
+
+    def _next_step_sleep_s(self) -> float:
+        """Return the next inter-step sleep in seconds, redrawing the batch each time it wraps."""
+        index = self._step_sleep_index
+        if index == 0:
+            self._step_sleeps_s = [ms / 1000.0 for ms in random.choices(self._step_sleep_range_ms, k=_STEP_SLEEP_BATCH)]
+        self._step_sleep_index = (index + 1) % _STEP_SLEEP_BATCH
+        return self._step_sleeps_s[index]
+
     def configure_logging(self, debug: bool):
         """Configures the logger level based on the debug flag."""
         log_level = logging.DEBUG if debug else logging.INFO
+        if logger.level == log_level:
+            # Already configured (every runner calls this on construction); only resync the mirror
+            _sync_debug_flag()
+            return
         # Configure our specific logger
         logger.setLevel(log_level)
         # Also configure handlers attached to our logger
         for handler in logger.handlers:
             handler.setLevel(log_level)
+        _sync_debug_flag()
         logger.info(f"Flow Generator logging level set to {logging.getLevelName(log_level)}")
 
     def create_aiohttp_connector(self) -> aiohttp.BaseConnector:
@@ -673,26 +1211,18 @@ class FlowRunner:
         resolver = None
         if self.target_ip:
             try:
-                # Setup custom DNS resolver
-                custom_resolver = aiohttp.resolver.AsyncResolver()
+                # Static resolver: the target hostname maps to target_ip with no lookup at all
                 override_host = self.original_host
-                # Determine port correctly (handle default ports)
-                override_port = self.parsed_url.port if self.parsed_url.port else self.default_port
-
-                # Ensure target_ip is valid (already validated by Pydantic, but belt-and-suspenders)
-                ip_address(self.target_ip)
+                override_port = self._override_port # Default port applied in __init__
 
-                # Add the override for the specific host/port pair
-                custom_resolver.add_override(override_host, override_port, self.target_ip)
+                # StaticResolver re-checks target_ip (already validated by Pydantic, but belt-and-suspenders)
+                resolver = StaticResolver(override_host, self.target_ip)
                 logger.info(f"DNS override configured: {override_host}:{override_port} -> {self.target_ip}")
-                resolver = custom_resolver
             except Exception as e:
-                 logger.error(f"Failed to configure DNS override for {self.original_host}:{self.parsed_url.port or self.default_port} -> {self.target_ip}. Error: {e}. Using default DNS.")
+                 logger.error(f"Failed to configure DNS override for {self.original_host}:{self._override_port} -> {self.target_ip}. Error: {e}. Using default DNS.")
                  resolver = None # Fallback to default
 
-        # Determine SSL context based on target scheme
-        # Use None for default SSL context (recommended), False to disable SSL checks (use with caution)
-        ssl_context = None if self.original_scheme == 'https' else False
+        ssl_context = self._connector_ssl
         if self.original_scheme != 'https' and ssl_context is None:
             logger.warning(f"Target scheme is '{self.original_scheme}', but default SSL context is being used. Consider setting ssl=False in TCPConnector if HTTPS is not intended.")
         elif self.original_scheme == 'https':
@@ -701,12 +1231,9 @@ class FlowRunner:
              logger.debug("SSL verification disabled for HTTP target.")
 
 
-        # Create the connector
-        # limit_per_host: Max connections per host pooled by this connector instance.
-        # limit: Total max connections pooled by this connector instance.
-        # Increase limits if many users hit the same target simultaneously.
-        connector_limit = max(100, self.config.sim_users * 2) # Example: allow more connections
-        connector_limit_per_host = max(50, self.config.sim_users) # Example: allow more per host
+        # Create the connector (limits sized in __init__)
+        connector_limit = self._connector_limit
+        connector_limit_per_host = self._connector_limit_per_host
         logger.debug(f"Creating TCPConnector: limit={connector_limit}, limit_per_host={connector_limit_per_host}, ssl={ssl_context is None}, resolver={'Custom' if resolver else 'Default'}")
         return aiohttp.TCPConnector(
             resolver=resolver,
@@ -731,6 +1258,7 @@ class FlowRunner:
             connector=connector,
             timeout=timeout,
             cookie_jar=None, # Explicitly disable automatic cookie handling per session
+            json_serialize=_json_dumps_str,
             connector_owner=False # Important: Connector is shared and managed outside
         )
 
@@ -744,13 +1272,14 @@ class FlowRunner:
             self._active_users_count = 0 # Reset counter
             self.user_tasks = []
             self._stopped_event = asyncio.Event() # Initialize the stop event
+            # Pool connections across users: keep-alives and TLS sessions are per connector
+            self._shared_connector = self.create_aiohttp_connector()
 
         logger.info(f"Starting {self.config.sim_users} simulated user tasks...")
-        for i in range(self.config.sim_users):
-            # Create task for each user
-            task = asyncio.create_task(self.simulate_user_lifecycle(user_id=i))
-            async with self.lock: # Protect appending to list
-                 self.user_tasks.append(task)
+        # Create every user task first, then publish them under a single lock acquire
+        tasks = [asyncio.create_task(self.simulate_user_lifecycle(user_id=i)) for i in range(self.config.sim_users)]
+        async with self.lock: # Protect extending the list
+            self.user_tasks.extend(tasks)
 
         logger.info(f"{self.config.sim_users} user tasks created and started.")
 
@@ -775,14 +1304,19 @@ class FlowRunner:
     async def stop_generating(self):
         """Stops the flow generation process gracefully."""
         async with self.lock: # Protect access to running flag and user_tasks list
-            if not self.running:
+            # A run_once user task clears running itself; the shared connector still
+            # marks a run whose tasks and pool have not been torn down yet.
+            if not self.running and self._shared_connector is None:
                 logger.warning("Flow generation not running or already stopping.")
                 # Ensure event is set just in case start_generating is somehow waiting
                 if hasattr(self, '_stopped_event') and self._stopped_event and not self._stopped_event.is_set():
                     self._stopped_event.set()
                 return
 
-            logger.info("Stopping flow generation...")
+            if self.running:
+                logger.info("Stopping flow generation...")
+            else:
+                logger.info("Flow generation already stopped by a user task; cleaning up.")
             self.running = False # Signal loops within user tasks to stop
 
             # --- Signal the start_generating loop to stop waiting ---
@@ -797,14 +1331,13 @@ class FlowRunner:
 
 
             # --- Cancel Active User Tasks ---
-            tasks_to_cancel = list(self.user_tasks) # Create copy for iteration
-            self.user_tasks = [] # Clear the main list
-            cancelled_count = 0
-            tasks_to_wait_for = []
+            tasks_to_cancel, self.user_tasks = self.user_tasks, [] # Take the list; no copy needed
 
         logger.debug(f"Found {len(tasks_to_cancel)} tasks associated with this generator instance.")
 
         # Cancel tasks outside the lock to avoid holding it during cancellation/waiting
+        cancelled_count = 0
+        tasks_to_wait_for = []
         for task in tasks_to_cancel:
             if task and not task.done():
                 tasks_to_wait_for.append(task)
@@ -814,7 +1347,7 @@ class FlowRunner:
                         cancelled_count += 1
                     except Exception as e:
                         logger.error(f"Error requesting cancellation for task {task}: {e}")
-            elif task and task.done():
+            elif task:
                  logger.debug(f"Task {task} was already done.")
 
 
@@ -822,22 +1355,35 @@ class FlowRunner:
 
         if tasks_to_wait_for:
             logger.debug(f"Waiting for {len(tasks_to_wait_for)} tasks to complete cancellation...")
-            # Wait for tasks to finish (handle CancelledError or complete normally)
-            results = await asyncio.gather(*tasks_to_wait_for, return_exceptions=True)
-            logger.info(f"User tasks cancellation acknowledged or tasks finished gathering (Count: {len(results)}).")
+            # Wait for tasks to finish (cancelled or completed normally); no results list is built
+            await asyncio.wait(tasks_to_wait_for)
+            logger.info(f"User tasks cancellation acknowledged or tasks finished (Count: {len(tasks_to_wait_for)}).")
 
             # Log any unexpected exceptions during shutdown
-            for i, result in enumerate(results):
-                 task_ref = tasks_to_wait_for[i] # Reference the original task if needed
-                 if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
-                      logger.error(f"Task {i} (Ref: {task_ref}) finished with unexpected error during stop: {result}", exc_info=result if self.config.debug else False)
-                 elif isinstance(result, asyncio.CancelledError):
+            for i, task_ref in enumerate(tasks_to_wait_for):
+                 if task_ref.cancelled():
                       logger.debug(f"Task {i} (Ref: {task_ref}) confirmed cancelled.")
-                 # else: Task finished normally or was already done
+                      continue
+                 result = task_ref.exception() # Also marks the exception as retrieved
+                 if isinstance(result, Exception):
+                      logger.error(f"Task {i} (Ref: {task_ref}) finished with unexpected error during stop: {result}", exc_info=result if _DEBUG else False)
+                 # else: Task finished normally
 
         else:
             logger.info("No active user tasks needed cancellation or waiting.")
 
+        # --- Close the shared connector now that no user task can use it ---
+        connector = self._shared_connector
+        self._shared_connector = None
+        if connector is not None and not connector.closed:
+            try:
+                await asyncio.wait_for(connector.close(), timeout=5.0)
+                logger.debug("Shared connector closed.")
+            except asyncio.TimeoutError:
+                logger.warning("Timeout closing shared connector.")
+            except Exception as conn_close_err:
+                logger.error(f"Error closing shared connector: {conn_close_err}")
+
         # Reset active count explicitly after ensuring tasks are stopped/gathered
         final_count_before_reset = self.get_active_user_count() # Use getter for thread safety if needed elsewhere
         self._active_users_count = 0 # Direct assignment ok since we are managing stop sequence
@@ -875,17 +1421,20 @@ class FlowRunner:
         Uses the updated get_value_from_context which handles complex paths and returns _MISSING sentinel.
         """
         if isinstance(data, str):
+            # Most strings carry neither marker character: two C-level scans, no method calls
+            if "{" not in data and "#" not in data:
+                return data
             # Special Token Substitution (##VAR:##) - Primarily for body construction
             if data.startswith("##VAR:") and data.endswith("##"):
                 try:
-                    # Unpack the type and path, use maxsplit=1
-                    parts = data[len("##VAR:"):-len("##")].split(":", 1)
-                    if len(parts) != 2:
+                    # Unpack the type and path (parsed once per distinct token)
+                    token = _parse_var_token(data)
+                    if token is None:
                         raise ValueError("Invalid ##VAR format, expected type:path")
-                    var_type, var_path = parts
+                    var_type, var_path, path_tokens = token
 
                     # Get value using the robust getter
-                    value = get_value_from_context(context, var_path)
+                    value = get_value_from_context(context, var_path, path_tokens)
 
                     if value is _MISSING:
                         logger.warning(f"Variable path '{var_path}' in ##VAR token '{data}' not found in context. Substituting with empty string/None.")
@@ -894,12 +1443,14 @@ class FlowRunner:
                     # Perform substitution based on type
                     if var_type == "string":
                         # Substitute as a string representation
-                        logger.debug(f"Substituting ##VAR:string:{var_path}## with string value: {str(value)}")
+                        if _DEBUG:
+                            logger.debug(f"Substituting ##VAR:string:{var_path}## with string value: {str(value)}")
                         return str(value)
                     elif var_type == "unquoted":
                         # Return the raw Python value (int, float, bool, list, dict, str, None)
                         # The JSON encoder in _execute_request_step handles Python types.
-                        logger.debug(f"Substituting ##VAR:unquoted:{var_path}## with raw value: {value} (type: {type(value).__name__})")
+                        if _DEBUG:
+                            logger.debug(f"Substituting ##VAR:unquoted:{var_path}## with raw value: {value} (type: {type(value).__name__})")
                         return value
                     else:
                         logger.warning(f"Unsupported ##VAR type: '{var_type}' in token '{data}'. Treating as string.")
@@ -913,25 +1464,26 @@ class FlowRunner:
 
             # Regular {{variable.or[0].path}} Substitution - For URLs, headers, string parts of body
             # This always results in a string substitution.
-            pattern = r"\{\{([\w\.\[\]]+?)\}\}" # Non-greedy match inside braces
+            if "{{" not in data:
+                return data # Common case: no placeholders, skip the template cache and regex
             new_string = data
             try:
-                # Use finditer for non-overlapping matches and correct replacement
-                matches = list(re.finditer(pattern, data))
-                if not matches:
+                segments = _compile_template(data)
+                if segments is None:
                      return data # No substitutions needed
 
+                # Walk the cached segments rather than re-scanning with _VAR_RE.sub:
+                # placeholder paths were stripped and tokenized once at compile time
                 result_parts = []
-                last_end = 0
-                for match in matches:
-                    var_path = match.group(1).strip() # Get path and strip whitespace
-                    start, end = match.span()
-
-                    # Append the literal text before the match
-                    result_parts.append(data[last_end:start])
+                append = result_parts.append
+                for literal, var_path, path_tokens in segments:
+                    # Append the literal text before the placeholder (or the trailing text)
+                    append(literal)
+                    if var_path is None:
+                        break
 
-                    # Get the value from context
-                    value = get_value_from_context(context, var_path)
+                    # Get the value from context (path already tokenized at compile time)
+                    value = get_value_from_context(context, var_path, path_tokens)
 
                     # Determine the string representation for substitution
                     if value is _MISSING:
@@ -943,29 +1495,26 @@ class FlowRunner:
                          value_str = str(value) # Convert other types to string
 
                     # Append the substituted value string
-                    result_parts.append(value_str)
-                    last_end = end
+                    append(value_str)
 
-                # Append any remaining literal text after the last match
-                result_parts.append(data[last_end:])
                 new_string = "".join(result_parts)
 
-            except re.error as e:
-                 logger.error(f"Regex error during variable substitution on '{data}': {e}")
-                 return data # Return original on regex failure
             except Exception as e:
                  # Catch potential errors from get_value_from_context or string conversion
                  logger.error(f"Unexpected error during variable substitution on '{data}': {e}", exc_info=self.config.debug)
                  return data # Return original on other failures
 
             # Log substitution only if it changed and debug is enabled
-            if logger.isEnabledFor(logging.DEBUG) and new_string != data:
+            if _DEBUG and new_string != data:
                 original_preview = data[:100] + ('...' if len(data) > 100 else '')
                 new_preview = new_string[:100] + ('...' if len(new_string) > 100 else '')
                 logger.debug(f"Substituted: '{original_preview}' -> '{new_preview}'")
             return new_string
 
         elif isinstance(data, dict):
+            # Template-free subtrees are returned as-is (shared, never mutated by callers)
+            if not _has_template(data):
+                return data
             # Recursively substitute in dictionary keys and values
             # Note: Substituting keys might have unintended consequences if keys become non-strings.
             # Let's assume keys remain strings after substitution for simplicity.
@@ -974,6 +1523,8 @@ class FlowRunner:
                 for key, val in data.items()
             }
         elif isinstance(data, list):
+            if not _has_template(data):
+                return data
             # Recursively substitute in list items
             return [self._substitute_variables(item, context) for item in data]
         else:
@@ -994,17 +1545,17 @@ class FlowRunner:
             logger.warning("Structured condition data is missing, defaulting to false")
             return False
 
-        variable_path = condition_data.variable.strip()
-        operator = condition_data.operator.strip()
+        variable_path = condition_data._variable_path
+        operator = condition_data._operator
         # value_str is the comparison value from the flowmap (always string initially)
-        value_str = condition_data.value if condition_data.value is not None else "" # Ensure string or ""
+        value_str = condition_data._value_str
 
         if not variable_path or not operator:
             logger.warning(f"Missing required condition fields: variable='{variable_path}', operator='{operator}'. Defaulting to False.")
             return False
 
         # Get the actual value from context using the path
-        left_value = get_value_from_context(context, variable_path)
+        left_value = get_value_from_context(context, variable_path, condition_data._path_tokens)
 
         # --- Handle Case: Variable Not Found in Context ---
         if left_value is _MISSING:
@@ -1014,127 +1565,20 @@ class FlowRunner:
             # This matches JS behavior where undefined acts like null in some comparisons.
             left_value = None # Treat missing variable as None for evaluation consistency
 
-        log_left_repr = repr(left_value)[:100] + ('...' if len(repr(left_value)) > 100 else '')
-        logger.debug(f"Evaluating structured condition: ContextVar '{variable_path}' (Value: {log_left_repr}, Type: {type(left_value).__name__}) | Operator: '{operator}' | ComparisonValue: '{value_str}'")
+        if _DEBUG:
+            left_repr = repr(left_value)
+            log_left_repr = left_repr[:100] + ('...' if len(left_repr) > 100 else '')
+            logger.debug(f"Evaluating structured condition: ContextVar '{variable_path}' (Value: {log_left_repr}, Type: {type(left_value).__name__}) | Operator: '{operator}' | ComparisonValue: '{value_str}'")
 
         # --- Evaluate based on operator ---
+        handler = _OPERATOR_DISPATCH.get(operator)
+        if handler is None:
+            logger.warning(f"Unknown structured condition operator: '{operator}'. Defaulting to False.")
+            return False
         try:
-            result = False # Default result
-
-            # --- Existence Checks (Robust to _MISSING via None conversion above) ---
-            if operator == 'exists': # Equivalent to JS `!= null` (checks not null/undefined)
-                result = left_value is not None
-            elif operator == 'not_exists': # Equivalent to JS `== null` (checks null/undefined)
-                result = left_value is None
-
-            # --- Type Checks ---
-            elif operator == 'is_number':
-                 # Exclude bools, check for NaN floats
-                 result = isinstance(left_value, (int, float)) and not isinstance(left_value, bool) and not (isinstance(left_value, float) and math.isnan(left_value))
-            elif operator == 'is_text':
-                 result = isinstance(left_value, str)
-            elif operator == 'is_boolean':
-                 result = isinstance(left_value, bool)
-            elif operator == 'is_array': # Python list corresponds to JS array
-                 result = isinstance(left_value, list)
-            # Optional: is_object (Python dict)
-            # elif operator == 'is_object': result = isinstance(left_value, dict)
-
-            # --- Boolean Value Checks ---
-            elif operator == 'is_true': # Strict check
-                 result = left_value is True
-            elif operator == 'is_false': # Strict check
-                 result = left_value is False
-
-            # --- Operators Requiring Comparison Value (value_str) ---
-            else:
-                # --- Comparison Logic with Type Coercion ---
-                # Try to coerce right side (value_str) towards left_value's type for comparison
-                coerced_right = _MISSING # Use sentinel for failed coercion attempt
-                can_compare_numerically = False
-
-                if isinstance(left_value, (int, float)) and not isinstance(left_value, bool):
-                    # Try converting value_str to number (int first, then float)
-                    try: coerced_right = int(value_str)
-                    except (ValueError, TypeError):
-                        try: coerced_right = float(value_str)
-                        except (ValueError, TypeError): pass # Coercion failed
-                    if coerced_right is not _MISSING:
-                         can_compare_numerically = True
-                         logger.debug(f"Coerced comparison value '{value_str}' to numeric type {type(coerced_right).__name__}")
-
-                elif isinstance(left_value, bool):
-                    # Try converting value_str to boolean ('true'/'false')
-                    val_str_lower = value_str.lower()
-                    if val_str_lower == 'true': coerced_right = True
-                    elif val_str_lower == 'false': coerced_right = False
-                    # else: coercion failed
-
-                # String/List/Dict comparisons typically use value_str directly
-
-                # --- Perform Comparison ---
-                if operator == 'equals':
-                    # 1. Try comparing with coerced type if successful
-                    if coerced_right is not _MISSING and type(left_value) is type(coerced_right):
-                        result = (left_value == coerced_right)
-                    # 2. Fallback: Compare string representations (useful for int 200 vs str "200")
-                    #    Only do this if coercion didn't produce the same type.
-                    #    Avoid for list/dict comparisons.
-                    elif isinstance(left_value, (int, float, bool, str, type(None))):
-                         result = (str(left_value) == value_str)
-                    # 3. Final check for None equality if left_value is None
-                    elif left_value is None:
-                         result = (value_str.lower() == 'null' or value_str.lower() == 'none' or value_str == "") # Check common None representations
-                    # else: Mismatched types where coercion/string comp doesn't apply -> False
-
-                elif operator == 'not_equals':
-                    # Similar logic to equals, but inverted
-                    if coerced_right is not _MISSING and type(left_value) is type(coerced_right):
-                        result = (left_value != coerced_right)
-                    elif isinstance(left_value, (int, float, bool, str, type(None))):
-                         result = (str(left_value) != value_str)
-                    elif left_value is None:
-                         result = not (value_str.lower() == 'null' or value_str.lower() == 'none' or value_str == "")
-                    else: # Mismatched types -> True
-                        result = True
-
-                # --- Numeric Comparisons (Requires successful numeric coercion) ---
-                elif operator in ('greater_than', 'less_than', 'greater_equals', 'less_equals'):
-                    if can_compare_numerically:
-                        # We already established left_value is number and coerced_right is number
-                        if operator == 'greater_than': result = left_value > coerced_right
-                        elif operator == 'less_than': result = left_value < coerced_right
-                        elif operator == 'greater_equals': result = left_value >= coerced_right
-                        elif operator == 'less_equals': result = left_value <= coerced_right
-                    else:
-                        logger.warning(f"Cannot perform numeric comparison '{operator}' because context value ({type(left_value).__name__}) or comparison value ('{value_str}') is not a compatible number.")
-                        result = False # Comparison fails if types aren't numeric
-
-                # --- String/Collection Operators ---
-                elif operator == 'contains':
-                    if isinstance(left_value, str): result = value_str in left_value
-                    elif isinstance(left_value, list): result = value_str in left_value or (coerced_right is not _MISSING and coerced_right in left_value) # Check raw string or coerced value
-                    elif isinstance(left_value, dict): result = value_str in left_value # Check if value_str is a key
-                    else: result = False # Cannot perform contains on numbers, bools, None
-
-                elif operator == 'starts_with':
-                    result = isinstance(left_value, str) and left_value.startswith(value_str)
-                elif operator == 'ends_with':
-                    result = isinstance(left_value, str) and left_value.endswith(value_str)
-
-                elif operator == 'matches_regex':
-                    if isinstance(left_value, str) and value_str:
-                         try: result = bool(re.search(value_str, left_value))
-                         except re.error as e: logger.error(f"Invalid regex pattern '{value_str}' in condition: {e}"); result = False
-                    else: result = False # Regex only applicable to strings
-
-                # --- Unknown Operator ---
-                else:
-                    logger.warning(f"Unknown structured condition operator: '{operator}'. Defaulting to False.")
-                    result = False
-
-
-            logger.debug(f"Condition evaluated to: {result}")
+            result = handler(left_value, condition_data)
+            if _DEBUG:
+                logger.debug(f"Condition evaluated to: {result}")
             return result
 
         except Exception as e:
@@ -1151,7 +1595,8 @@ class FlowRunner:
         # --- Preferred Method: Structured Data ---
         # Check for valid structured data (variable and operator must be present)
         if condition_data and condition_data.variable and condition_data.operator:
-            logger.debug(f"Using structured condition data for evaluation (Variable: '{condition_data.variable}', Operator: '{condition_data.operator}').")
+            if _DEBUG:
+                logger.debug(f"Using structured condition data for evaluation (Variable: '{condition_data.variable}', Operator: '{condition_data.operator}').")
             return self._evaluate_structured_condition(condition_data, context)
 
         # --- Fallback Method: Legacy String Parsing ---
@@ -1169,19 +1614,15 @@ class FlowRunner:
             if not isinstance(substituted_condition, str):
                  logger.error(f"Legacy condition '{condition_str}' substitution resulted in non-string type: {type(substituted_condition)}. Cannot evaluate.")
                  return False
-            logger.debug(f"Substituted legacy condition: '{substituted_condition}'")
+            if _DEBUG:
+                logger.debug(f"Substituted legacy condition: '{substituted_condition}'")
         except Exception as e:
              logger.error(f"Error substituting variables in legacy condition '{condition_str}': {e}. Cannot evaluate.")
              return False
 
 
         # Simplified Regex: Looks for operand, operator, operand. Handles optional quotes.
-        # WARNING: This is fragile. Structured conditions are strongly preferred.
-        match = re.match(r"""^\s*  # Start of string, optional whitespace
-               (.*?)\s*   # Left operand (non-greedy)
-               (?:(===|==|!==|!=|>|<|>=|<=)\s*(.*?))?  # Optional: Operator and Right operand
-               \s*$       # End of string, optional whitespace""",
-               substituted_condition, re.VERBOSE | re.DOTALL)
+        match = _LEGACY_CONDITION_RE.match(substituted_condition)
 
 
         if not match:
@@ -1201,7 +1642,8 @@ class FlowRunner:
                 # Attempt numeric conversion for non-zero numbers
                 try: result = bool(float(val_str)) # '0.0' is False
                 except ValueError: result = True # Non-empty, non-keyword, non-numeric string is true
-            logger.debug(f"Legacy condition '{substituted_condition}' evaluated as simple truthiness: {result}")
+            if _DEBUG:
+                logger.debug(f"Legacy condition '{substituted_condition}' evaluated as simple truthiness: {result}")
             return result
 
         # --- Evaluate Comparison if operator exists ---
@@ -1223,7 +1665,8 @@ class FlowRunner:
         left_val = interpret_legacy(left_str)
         right_val = interpret_legacy(right_str)
 
-        logger.debug(f"Legacy interpreted: Left='{left_val}' ({type(left_val).__name__}), Op='{op}', Right='{right_val}' ({type(right_val).__name__})")
+        if _DEBUG:
+            logger.debug(f"Legacy interpreted: Left='{left_val}' ({type(left_val).__name__}), Op='{op}', Right='{right_val}' ({type(right_val).__name__})")
 
         try:
             if op == '===': result = (type(left_val) is type(right_val)) and (left_val == right_val)
@@ -1236,7 +1679,8 @@ class FlowRunner:
             elif op == '>=': result = left_val >= right_val
             elif op == '<=': result = left_val <= right_val
             else: logger.warning(f"Unknown legacy operator '{op}'. Defaulting to False."); result = False
-            logger.debug(f"Legacy condition comparison result: {result}")
+            if _DEBUG:
+                logger.debug(f"Legacy condition comparison result: {result}")
             return result
         except TypeError:
             # Incompatible types for >, <, >=, <=. For ==, !=, Python handles some coercion.
@@ -1312,9 +1756,10 @@ class FlowRunner:
 
                 # --- Log and Update Context ---
                 if extracted_value is not _MISSING:
-                    log_val_repr = repr(extracted_value)
-                    log_val_display = f"{log_val_repr[:100]}{'...' if len(log_val_repr) > 100 else ''}"
-                    logger.debug(f"Extracted '{path_expr}' (from {source_description}) into context variable '{var_name}': {log_val_display} ({type(extracted_value).__name__})")
+                    if _DEBUG:
+                        log_val_repr = repr(extracted_value)
+                        log_val_display = f"{log_val_repr[:100]}{'...' if len(log_val_repr) > 100 else ''}"
+                        logger.debug(f"Extracted '{path_expr}' (from {source_description}) into context variable '{var_name}': {log_val_display} ({type(extracted_value).__name__})")
                     set_value_in_context(context, var_name, extracted_value) # Set the actual extracted value
                 else:
                     # Log failure clearly: path not found within the specified source
@@ -1347,21 +1792,32 @@ class FlowRunner:
         MODIFIED: Implements onFailure logic for status codes >= 300.
         """
         step_identifier = f"'{step.name}' ({step.id})" if step.name else f"({step.id})"
-        context_prefix = f'response_{step.id}' # Prefix for storing response info
 
         # --- Prepare Request ---
         try:
             method = step.method
             # Substitute variables in URL path, step-specific headers, and body
             # Global flow headers are assumed to be already substituted by _execute_steps
-            url_path_substituted = self._substitute_variables(step.url, context)
-            step_headers_substituted = self._substitute_variables(step.headers or {}, context)
-            step_body_substituted = self._substitute_variables(step.body, context) # Handles ##VAR tokens
+            # Template-free URLs/headers/bodies were detected at validation time and skip substitution
+            if step._url_needs_substitution:
+                url_path_substituted = self._substitute_variables(step.url, context)
+            else:
+                url_path_substituted = step.url
+            if step._headers_need_substitution:
+                step_headers_substituted = self._substitute_variables(step.headers or {}, context)
+            else:
+                step_headers_substituted = step.headers or {}
+            if step._static_json_body is not None:
+                step_body_substituted = None # Sent from the pre-serialized bytes below
+            elif step._body_renderer is not None:
+                step_body_substituted = step._body_renderer(self._substitute_variables, context) # Handles ##VAR tokens
+            else:
+                step_body_substituted = step.body
 
             if not isinstance(url_path_substituted, str):
                 logger.error(f"Step {step_identifier}: URL substitution resulted in non-string: {type(url_path_substituted)}. Skipping request.")
-                set_value_in_context(context, f'{context_prefix}_status', 599)
-                set_value_in_context(context, f'{context_prefix}_error', f"URL substitution failed: type {type(url_path_substituted)}")
+                set_value_in_context(context, step._status_key, 599)
+                set_value_in_context(context, step._error_key, f"URL substitution failed: type {type(url_path_substituted)}")
                 return False # Indicate internal failure
 
             final_url = ""
@@ -1369,11 +1825,11 @@ class FlowRunner:
 
             # --- Build Final URL & Handle DNS Override ---
             try:
-                parsed_substituted_url = urlparse(url_path_substituted)
+                parsed_substituted_url = step._parsed_url if step._parsed_url is not None else urlparse(url_path_substituted)
             except ValueError as e:
                 logger.error(f"Step {step_identifier}: Invalid URL format after substitution: '{url_path_substituted}'. Error: {e}. Skipping request.")
-                set_value_in_context(context, f'{context_prefix}_status', 599)
-                set_value_in_context(context, f'{context_prefix}_error', f"Invalid URL format: {url_path_substituted}")
+                set_value_in_context(context, step._status_key, 599)
+                set_value_in_context(context, step._error_key, f"Invalid URL format: {url_path_substituted}")
                 return False
 
             if self.config.override_step_url_host:
@@ -1384,20 +1840,17 @@ class FlowRunner:
                 step_fragment = parsed_substituted_url.fragment
 
                 if self.target_ip:
-                    port = self.parsed_url.port or self.default_port
-                    ip_part = f"[{self.target_ip}]" if ':' in self.target_ip else self.target_ip
-                    netloc = (
-                        f"{ip_part}:{port}" if (self.original_scheme == 'https' and port != 443) or (self.original_scheme == 'http' and port != 80) else ip_part
-                    )
+                    netloc = self._override_netloc
                     host_header_override = self.original_host
                 else:
                     netloc = self.parsed_url.netloc
 
                 final_url = urlunparse((self.original_scheme, netloc, step_path, '', step_query, step_fragment))
-                logger.debug(
-                    f"Step {step_identifier}: URL Override Active. Final URL: {final_url}" +
-                    (f" (Host header: {host_header_override})" if host_header_override else "")
-                )
+                if _DEBUG:
+                    logger.debug(
+                        f"Step {step_identifier}: URL Override Active. Final URL: {final_url}" +
+                        (f" (Host header: {host_header_override})" if host_header_override else "")
+                    )
             else:
                 if parsed_substituted_url.scheme and parsed_substituted_url.netloc:
                     final_url = url_path_substituted
@@ -1412,58 +1865,54 @@ class FlowRunner:
                             (parsed_substituted_url.scheme, netloc, parsed_substituted_url.path or '/', parsed_substituted_url.params, parsed_substituted_url.query, parsed_substituted_url.fragment)
                         )
                         host_header_override = step_host
-                        logger.debug(
-                            f"Step {step_identifier}: DNS override applied to absolute URL -> {final_url} (Host: {host_header_override})"
-                        )
+                        if _DEBUG:
+                            logger.debug(
+                                f"Step {step_identifier}: DNS override applied to absolute URL -> {final_url} (Host: {host_header_override})"
+                            )
                     else:
-                        logger.debug(f"Step {step_identifier}: Using absolute URL '{final_url}' directly (override inactive).")
+                        if _DEBUG:
+                            logger.debug(f"Step {step_identifier}: Using absolute URL '{final_url}' directly (override inactive).")
                 else:
                     base_url_config = self.config.flow_target_url.rstrip('/')
                     path_part = url_path_substituted.lstrip('./')
 
-                    required_params = re.findall(r"\{\{([\w\.\[\]]+?)\}\}", step.url)
-                    if required_params and path_part.endswith('/') and not step.url.rstrip('/').endswith('/'):
-                        missing_param_found = False
-                        for param in required_params:
-                            param_val = get_value_from_context(context, param)
-                            if param_val is _MISSING or param_val is None or param_val == "":
-                                if step.url.rstrip('/').endswith(f"{{{{{param}}}}}"):
-                                    logger.error(
-                                        f"Step {step_identifier}: URL path parameter '{{{{{param}}}}}' is missing or empty after substitution ('{url_path_substituted}'). Skipping request."
-                                    )
-                                    set_value_in_context(context, f'{context_prefix}_status', 599)
-                                    set_value_in_context(context, f'{context_prefix}_error', f"Missing URL path parameter '{param}' in '{url_path_substituted}'")
-                                    missing_param_found = True
-                                    break
-                        if missing_param_found:
+                    # Only a placeholder ending the URL can leave a dangling '/'; found at validation
+                    param = step._trailing_url_param
+                    if param is not None and path_part.endswith('/'):
+                        param_val = get_value_from_context(context, param)
+                        if param_val is _MISSING or param_val is None or param_val == "":
+                            logger.error(
+                                f"Step {step_identifier}: URL path parameter '{{{{{param}}}}}' is missing or empty after substitution ('{url_path_substituted}'). Skipping request."
+                            )
+                            set_value_in_context(context, step._status_key, 599)
+                            set_value_in_context(context, step._error_key, f"Missing URL path parameter '{param}' in '{url_path_substituted}'")
                             return False
 
                     if self.target_ip:
-                        port = self.parsed_url.port or self.default_port
-                        ip_part = f"[{self.target_ip}]" if ':' in self.target_ip else self.target_ip
-                        netloc = (
-                            f"{ip_part}:{port}" if (self.original_scheme == 'https' and port != 443) or (self.original_scheme == 'http' and port != 80) else ip_part
-                        )
-                        final_url = urlunparse((self.original_scheme, netloc, path_part, '', '', ''))
+                        final_url = urlunparse((self.original_scheme, self._override_netloc, path_part, '', '', ''))
                         host_header_override = self.original_host
-                        logger.debug(
-                            f"Step {step_identifier}: Applying DNS override to relative path '{path_part}' -> {final_url} (Host: {host_header_override})"
-                        )
+                        if _DEBUG:
+                            logger.debug(
+                                f"Step {step_identifier}: Applying DNS override to relative path '{path_part}' -> {final_url} (Host: {host_header_override})"
+                            )
 
                     else:
                         final_url = f"{base_url_config}/{path_part}"
-                        logger.debug(
-                            f"Step {step_identifier}: Using relative path '{path_part}' with base URL -> {final_url}"
-                        )
+                        if _DEBUG:
+                            logger.debug(
+                                f"Step {step_identifier}: Using relative path '{path_part}' with base URL -> {final_url}"
+                            )
 
             # --- Encode Query Parameter Values to Avoid WAF Issues ---
             try:
-                if self.config.debug:
+                if _DEBUG:
                     logger.debug(
                         f"Step {step_identifier}: URL before query re-encoding: {final_url}"
                     )
-                parsed_final = urlparse(final_url)
-                if parsed_final.query:
+                # No '?' means no query: skip the parse. A query of plain key=value pairs
+                # would come back from parse_qsl/urlencode unchanged, so leave it as is.
+                parsed_final = urlparse(final_url) if '?' in final_url else None
+                if parsed_final is not None and parsed_final.query and not _CANONICAL_QUERY_RE.fullmatch(parsed_final.query):
                     safe_qs = parsed_final.query.replace('+', '%2B')
                     pairs = parse_qsl(safe_qs, keep_blank_values=True)
                     encoded_query = urlencode(pairs, doseq=True, quote_via=quote)
@@ -1477,7 +1926,7 @@ class FlowRunner:
                             parsed_final.fragment,
                         )
                     )
-                    if self.config.debug:
+                    if _DEBUG:
                         logger.debug(
                             f"Step {step_identifier}: URL after query re-encoding: {final_url}"
                         )
@@ -1489,13 +1938,14 @@ class FlowRunner:
 
 
             # --- Combine Headers ---
-            final_headers = base_headers.copy() # Start with user session headers
-            final_headers.update(flow_headers) # Add/override with global flow headers
-            # Ensure step headers are dicts before updating
+            # User session headers, overridden by global flow headers, then step-specific
+            # headers; built in one dict display (template-free step headers are the step's own dict)
             if isinstance(step_headers_substituted, dict):
-                final_headers.update(step_headers_substituted) # Add/override with step-specific headers
-            elif step_headers_substituted:
-                 logger.warning(f"Step {step_identifier}: Step headers substitution resulted in non-dict: {type(step_headers_substituted)}. Ignoring step headers.")
+                final_headers = {**base_headers, **flow_headers, **step_headers_substituted}
+            else:
+                final_headers = {**base_headers, **flow_headers}
+                if step_headers_substituted:
+                    logger.warning(f"Step {step_identifier}: Step headers substitution resulted in non-dict: {type(step_headers_substituted)}. Ignoring step headers.")
 
             if host_header_override:
                 final_headers['Host'] = host_header_override # Apply Host override if needed
@@ -1504,7 +1954,13 @@ class FlowRunner:
             # --- Prepare Request Body ---
             data_payload = None
             json_payload = None
-            if step_body_substituted is not None:
+            if step._static_json_body is not None:
+                # Serialized once per step with the session's json_serialize encoder
+                # (_json_dumps_bytes), so it is the same JSON json= would send
+                data_payload = step._static_json_body
+                if 'application/json' not in final_headers.get('Content-Type', '').lower():
+                    final_headers['Content-Type'] = 'application/json; charset=utf-8'
+            elif step_body_substituted is not None:
                 content_type = final_headers.get('Content-Type', '').lower()
                 is_json_content_type = 'application/json' in content_type
 
@@ -1513,14 +1969,16 @@ class FlowRunner:
                     json_payload = step_body_substituted
                     if not is_json_content_type:
                         final_headers['Content-Type'] = 'application/json; charset=utf-8'
-                        logger.debug(f"Step {step_identifier}: Automatically set Content-Type to application/json for dict/list body.")
+                        if _DEBUG:
+                            logger.debug(f"Step {step_identifier}: Automatically set Content-Type to application/json for dict/list body.")
                 elif isinstance(step_body_substituted, str):
                     # Body is string. Check Content-Type.
                     if is_json_content_type:
                         # Try to parse string as JSON if Content-Type suggests it
                         try:
                             json_payload = json.loads(step_body_substituted)
-                            logger.debug(f"Step {step_identifier}: Parsed string body as JSON based on Content-Type.")
+                            if _DEBUG:
+                                logger.debug(f"Step {step_identifier}: Parsed string body as JSON based on Content-Type.")
                         except json.JSONDecodeError:
                             logger.warning(f"Step {step_identifier}: Content-Type is JSON, but body is not valid JSON. Sending as raw string data.")
                             data_payload = step_body_substituted.encode('utf-8', errors='replace')
@@ -1537,7 +1995,7 @@ class FlowRunner:
                     data_payload = str(step_body_substituted).encode('utf-8', errors='replace')
 
 
-            if logger.isEnabledFor(logging.DEBUG):
+            if _DEBUG:
                 log_headers = {k: ('********' if isinstance(v, str) and (k.lower() == 'authorization' or k.lower() == 'cookie') and v else v) for k, v in final_headers.items()}
                 log_payload_summary = "None"
                 if json_payload is not None:
@@ -1555,8 +2013,8 @@ class FlowRunner:
 
         except Exception as prep_err:
              logger.error(f"Step {step_identifier}: Unexpected error during request preparation: {prep_err}", exc_info=self.config.debug)
-             set_value_in_context(context, f'{context_prefix}_status', 599)
-             set_value_in_context(context, f'{context_prefix}_error', f"Request preparation error: {prep_err}")
+             set_value_in_context(context, step._status_key, 599)
+             set_value_in_context(context, step._error_key, f"Request preparation error: {prep_err}")
              return False # Indicate internal failure
 
 
@@ -1594,7 +2052,10 @@ class FlowRunner:
                     try:
                         resp_content_type = resp.headers.get('Content-Type', '').lower()
                         if 'application/json' in resp_content_type:
-                             try: response_body = await resp.json(encoding='utf-8')
+                             try:
+                                 raw_body = await resp.read()
+                                 # Empty body decodes to None, as resp.json() did
+                                 response_body = _json_loads(raw_body) if raw_body.strip() else None
                              except (json.JSONDecodeError, UnicodeDecodeError, aiohttp.ContentTypeError) as json_err:
                                  logger.warning(f"Step {step_identifier}: Failed to decode JSON response ({resp.status}) despite Content-Type. Error: {json_err}. Reading as text.")
                                  # Fallback: read as text
@@ -1607,7 +2068,8 @@ class FlowRunner:
                              limit = 100
                              if len(raw_bytes) > limit: response_body = f"[Body Binary Data - Type: {resp_content_type}, Size: {len(raw_bytes)} bytes, Starts: {raw_bytes[:limit]!r}...]"
                              else: response_body = f"[Body Binary Data - Type: {resp_content_type}, Size: {len(raw_bytes)} bytes, Data: {raw_bytes!r}]"
-                             logger.debug(f"Step {step_identifier}: Read {len(raw_bytes)} bytes for Content-Type: {resp_content_type}")
+                             if _DEBUG:
+                                 logger.debug(f"Step {step_identifier}: Read {len(raw_bytes)} bytes for Content-Type: {resp_content_type}")
 
                     except aiohttp.ClientPayloadError as payload_err:
                         logger.error(f"Step {step_identifier}: Payload error reading response body ({resp.status}): {payload_err}")
@@ -1621,7 +2083,7 @@ class FlowRunner:
                     log_level = logging.WARNING if response_status >= 400 else logging.INFO
                     logger.log(log_level, f"Step {step_identifier} received: {response_status} {method} {final_url} ({request_duration_s*1000:.2f} ms)")
 
-                    if logger.isEnabledFor(logging.DEBUG):
+                    if _DEBUG:
                         log_body_repr = repr(response_body)
                         log_body_display = f"{log_body_repr[:250]}{'...' if len(log_body_repr) > 250 else ''}"
                         log_resp_headers = {k: ('********' if k.lower() == 'set-cookie' and v else v) for k, v in response_headers_dict.items()}
@@ -1674,12 +2136,12 @@ class FlowRunner:
 
         # --- Post-Request Processing ---
         # Update context with final status, headers, body, and error message (ALWAYS do this)
-        set_value_in_context(context, f'{context_prefix}_status', response_status)
-        set_value_in_context(context, f'{context_prefix}_headers', response_headers_dict)
-        set_value_in_context(context, f'{context_prefix}_body', response_body)
+        set_value_in_context(context, step._status_key, response_status)
+        set_value_in_context(context, step._headers_key, response_headers_dict)
+        set_value_in_context(context, step._body_key, response_body)
 
         # Set or clear the error message in context
-        error_key_path = f'{context_prefix}_error'
+        error_key_path = step._error_key
         if error_message:
             set_value_in_context(context, error_key_path, error_message)
         else:
@@ -1707,28 +2169,101 @@ class FlowRunner:
 
         # Data Extraction (only if request completed AND flow is not stopping due to onFailure=stop)
         if request_succeeded and not flow_should_stop and step.extract:
-             logger.debug(f"Step {step_identifier}: Performing data extraction.")
+             if _DEBUG:
+                 logger.debug(f"Step {step_identifier}: Performing data extraction.")
              self._extract_data(response_body, step.extract, context, response_status, response_headers_dict)
         elif flow_should_stop:
-             logger.debug(f"Step {step_identifier}: Skipping extraction due to onFailure=stop.")
+             if _DEBUG:
+                 logger.debug(f"Step {step_identifier}: Skipping extraction due to onFailure=stop.")
         elif not request_succeeded:
-             logger.debug(f"Step {step_identifier}: Skipping extraction due to request execution failure.")
+             if _DEBUG:
+                 logger.debug(f"Step {step_identifier}: Skipping extraction due to request execution failure.")
 
 
         # Increment metrics only if the request was actually sent and received a response status
         if request_succeeded:
-             await self.metrics.increment()
+             self.metrics.increment()
              return True # Indicate step executed (the _execute_steps loop will check flow_error)
         else:
              # Set flow error if request failed internally (connection, timeout, prep)
              # Only set if flow_error isn't already set (e.g., by onFailure=stop)
              final_error_msg = error_message if error_message else "Request failed before completion"
-             current_flow_error = get_value_from_context(context, 'flow_error')
+             current_flow_error = get_value_from_context(context, 'flow_error', _FLOW_ERROR_PATH)
              if current_flow_error is _MISSING or current_flow_error is None:
                  set_value_in_context(context, 'flow_error', f"Step {step_identifier} failed internally: {final_error_msg}")
              return False # Indicate step failed internally
 
 
+    # --- Step dispatch ---
+    # Uniform-signature adapters used by _execute_steps via _STEP_DISPATCH. They look
+    # the executors up on self at call time, so instance-level overrides still apply.
+
+    async def _dispatch_request_step(self, step, session, base_headers, flow_headers, flow_headers_substituted, context, depth, user_id_log, step_identifier) -> None:
+        indent = "  " * depth
+        # Execute request and check internal success (True if request happened)
+        # _execute_request_step now handles onFailure logic internally
+        step_executed = await self._execute_request_step(
+            step=step,
+            session=session,
+            base_headers=base_headers,
+            flow_headers=flow_headers_substituted, # Pass substituted global headers
+            context=context
+        )
+        # If step failed internally (e.g., bad URL param) or stopped due to onFailure=stop,
+        # flow_error should be set in the context.
+        # The check at the start of the *next* loop iteration will handle sequence halting.
+        if not step_executed:
+             logger.warning(f"{indent}User {user_id_log}: Request step {step_identifier} failed internal execution checks. Flow error should be set.")
+             # Rely on the check at the top of the loop to halt if needed.
+
+    async def _dispatch_condition_step(self, step, session, base_headers, flow_headers, flow_headers_substituted, context, depth, user_id_log, step_identifier) -> None:
+        indent = "  " * depth
+        condition_data_model = step.conditionData # Might be None
+        condition_result = self._evaluate_condition(
+            condition_str=step.condition, # Legacy string (optional)
+            context=context,
+            condition_data=condition_data_model # Structured data (preferred)
+        )
+
+        # Log evaluation result
+        cond_desc = "N/A"
+        if condition_data_model and condition_data_model.variable:
+            cond_desc = f"'{condition_data_model.variable}' {condition_data_model.operator} '{condition_data_model.value}'"
+        elif step.condition:
+            cond_desc = f"Legacy: '{step.condition}'"
+        logger.info(f"{indent}User {user_id_log}: Condition {step_identifier}: {cond_desc} -> {condition_result}")
+
+        branch_to_execute_data = step.then if condition_result else step.else_
+        branch_name = "then" if condition_result else "else"
+
+        # branch_to_execute_data might be a list of dicts or models here
+        if branch_to_execute_data: # Ensure list is not empty
+            if _DEBUG:
+                logger.debug(f"{indent}User {user_id_log}: Executing '{branch_name}' branch for {step_identifier} ({len(branch_to_execute_data)} steps)...")
+            # Recurse: Pass the list (containing dicts/models), original flow_headers, context, increased depth
+            await self._execute_steps(branch_to_execute_data, session, base_headers, flow_headers, context, depth + 1)
+            # Error propagation: If the sub-sequence set flow_error, the check at the top of the next loop iteration will catch it.
+        else:
+            if _DEBUG:
+                logger.debug(f"{indent}User {user_id_log}: No steps found in '{branch_name}' branch for {step_identifier}.")
+
+    async def _dispatch_loop_step(self, step, session, base_headers, flow_headers, flow_headers_substituted, context, depth, user_id_log, step_identifier) -> None:
+        await self._execute_loop_step(
+            step,
+            session,
+            base_headers,
+            flow_headers,
+            context,
+            depth,
+            user_id_log,
+        )
+
+    _STEP_DISPATCH = {
+        RequestStep: _dispatch_request_step,
+        ConditionStep: _dispatch_condition_step,
+        LoopStep: _dispatch_loop_step,
+    }
+
     async def _execute_loop_step(
         self,
         step: LoopStep,
@@ -1777,17 +2312,18 @@ class FlowRunner:
                 logger.info(f"{indent}  User {user_id_log}: Stop signal received, breaking loop {step_identifier}.")
                 break
 
-            loop_error_check = get_value_from_context(context, 'flow_error')
+            loop_error_check = get_value_from_context(context, 'flow_error', _FLOW_ERROR_PATH)
             if loop_error_check is not _MISSING and loop_error_check is not None:
                 logger.warning(
                     f"{indent}  User {user_id_log}: Flow error detected before loop iteration {index+1} ('{loop_error_check}'), breaking loop {step_identifier}."
                 )
                 break
 
-            logger.debug(f"{indent}  User {user_id_log}: Loop {step_identifier} - Iteration {index+1}/{item_count}")
+            if _DEBUG:
+                logger.debug(f"{indent}  User {user_id_log}: Loop {step_identifier} - Iteration {index+1}/{item_count}")
 
             try:
-                loop_context = copy.deepcopy(context)
+                loop_context = _fast_copy(context)
             except Exception as copy_err:
                 logger.error(
                     f"{indent}  User {user_id_log}: Failed to deepcopy context for loop {step_identifier} iteration {index+1}: {copy_err}. Using shallow copy (RISKY)."
@@ -1799,7 +2335,7 @@ class FlowRunner:
 
             await self._execute_steps(step.steps, session, base_headers, flow_headers, loop_context, depth + 1)
 
-            iteration_error = get_value_from_context(loop_context, 'flow_error')
+            iteration_error = get_value_from_context(loop_context, 'flow_error', _FLOW_ERROR_PATH)
             if iteration_error is not _MISSING and iteration_error is not None:
                 logger.warning(
                     f"{indent}  User {user_id_log}: Error detected within loop {step_identifier} iteration {index+1}: {iteration_error}"
@@ -1825,7 +2361,8 @@ class FlowRunner:
         user_id_log = context.get('userId', 'Unknown')
         total_steps = len(steps)
         indent = "  " * depth # Indentation for logging nested structures
-        logger.debug(f"{indent}User {user_id_log}: Executing sequence of {total_steps} steps...")
+        if _DEBUG:
+            logger.debug(f"{indent}User {user_id_log}: Executing sequence of {total_steps} steps...")
 
         # Substitute global headers once at the start of this sequence using current context
         current_flow_headers_substituted = self._substitute_variables(flow_headers, context)
@@ -1838,21 +2375,25 @@ class FlowRunner:
             if not self.running:
                 logger.info(f"{indent}User {user_id_log}: Stop signal received, halting step execution sequence.")
                 return # Stop this sequence
-            flow_error_check = get_value_from_context(context, 'flow_error')
+            flow_error_check = get_value_from_context(context, 'flow_error', _FLOW_ERROR_PATH)
             if flow_error_check is not _MISSING and flow_error_check is not None:
                  logger.warning(f"{indent}User {user_id_log}: Flow error detected ('{flow_error_check}'), halting step execution sequence.")
                  return # Stop this sequence
 
             # --- FIX: Dynamic Validation of Steps ---
             step_instance = None # Holds the validated Pydantic model instance
-            if isinstance(step_data, (RequestStep, ConditionStep, LoopStep)):
+            if type(step_data) in self._STEP_DISPATCH:
                  # Already a validated model (likely from top-level parsing)
                  step_instance = step_data
+            elif isinstance(step_data, dict) and (cached := self._validated_steps.get(id(step_data))) and cached[0] is step_data:
+                 # Dict already validated by an earlier iteration
+                 step_instance = cached[1]
             elif isinstance(step_data, dict):
                  # Attempt to validate the dictionary into a FlowStep model
                  step_id_for_log = step_data.get('id', 'Unknown ID')
                  step_type_for_log = step_data.get('type', 'Unknown Type')
-                 logger.debug(f"{indent}User {user_id_log}: Step {i+1}/{total_steps} is dict (ID: {step_id_for_log}, Type: {step_type_for_log}). Attempting dynamic validation.")
+                 if _DEBUG:
+                     logger.debug(f"{indent}User {user_id_log}: Step {i+1}/{total_steps} is dict (ID: {step_id_for_log}, Type: {step_type_for_log}). Attempting dynamic validation.")
 
                  try:
                      # Determine which concrete model to use based on 'type'
@@ -1861,16 +2402,15 @@ class FlowRunner:
                          raise ValueError(f"Step is missing required 'type' field")
 
                      # Validate against the appropriate concrete model
-                     if step_type == 'request':
-                         step_instance = RequestStep.model_validate(step_data)
-                     elif step_type == 'condition':
-                         step_instance = ConditionStep.model_validate(step_data)
-                     elif step_type == 'loop':
-                         step_instance = LoopStep.model_validate(step_data)
-                     else:
+                     step_model = _STEP_MODELS.get(step_type)
+                     if step_model is None:
                          raise ValueError(f"Unknown step type: {step_type}")
+                     step_instance = step_model.model_validate(step_data)
+                     # Keep a reference to the dict so its id() cannot be reused while cached
+                     self._validated_steps[id(step_data)] = (step_data, step_instance)
 
-                     logger.debug(f"{indent}User {user_id_log}: Dynamically validated step dict {step_id_for_log} into {type(step_instance).__name__}")
+                     if _DEBUG:
+                         logger.debug(f"{indent}User {user_id_log}: Dynamically validated step dict {step_id_for_log} into {type(step_instance).__name__}")
                  except Exception as val_err:
                      # Enhanced error handling with detailed diagnostics
                      error_detail = str(val_err)
@@ -1878,8 +2418,8 @@ class FlowRunner:
                          error_detail += f" Caused by: {val_err.__cause__}"
 
                      logger.error(f"{indent}User {user_id_log}: Failed to validate step dict (ID: {step_id_for_log}) into a FlowStep model: {error_detail}. Halting sequence.")
-                     if self.config.debug:
-                         logger.debug(f"Validation traceback:\n{traceback.format_exc()}")
+                     if _DEBUG:
+                         logger.debug("Validation traceback:", exc_info=True)
 
                      set_value_in_context(context, 'flow_error', f"Validation error for step ID {step_id_for_log}: {val_err}")
                      return # Stop this sequence
@@ -1896,10 +2436,10 @@ class FlowRunner:
 
             # --- Inter-step Sleep ---
             if i > 0: # Don't sleep before the first step
-                sleep_duration_ms = random.randint(self.config.min_sleep_ms, self.config.max_sleep_ms)
-                if sleep_duration_ms > 0:
-                    sleep_duration_sec = sleep_duration_ms / 1000.0
-                    logger.debug(f"{indent}User {user_id_log}: Sleeping for {sleep_duration_sec:.3f}s before step {step_identifier} ({i+1}/{total_steps})")
+                sleep_duration_sec = self._next_step_sleep_s()
+                if sleep_duration_sec > 0:
+                    if _DEBUG:
+                        logger.debug(f"{indent}User {user_id_log}: Sleeping for {sleep_duration_sec:.3f}s before step {step_identifier} ({i+1}/{total_steps})")
                     try:
                         await asyncio.sleep(sleep_duration_sec)
                     except asyncio.CancelledError:
@@ -1910,80 +2450,28 @@ class FlowRunner:
             # Re-check running status after sleep
             if not self.running: logger.info(f"{indent}User {user_id_log}: Stop signal received after sleep, halting."); return
             # Re-check flow error status after sleep
-            flow_error_check_after_sleep = get_value_from_context(context, 'flow_error')
+            flow_error_check_after_sleep = get_value_from_context(context, 'flow_error', _FLOW_ERROR_PATH)
             if flow_error_check_after_sleep is not _MISSING and flow_error_check_after_sleep is not None:
                 logger.warning(f"{indent}User {user_id_log}: Flow error detected after sleep ('{flow_error_check_after_sleep}'), halting."); return
 
 
             # --- Execute Step based on Type ---
             step_type = step_instance.type
-            logger.debug(f"{indent}User {user_id_log}: Processing Step {i+1}/{total_steps}: {step_identifier} (Type: {step_type})")
+            if _DEBUG:
+                logger.debug(f"{indent}User {user_id_log}: Processing Step {i+1}/{total_steps}: {step_identifier} (Type: {step_type})")
             step_start_time = time.monotonic()
 
             try:
-                # --- Request Step ---
-                if isinstance(step_instance, RequestStep):
-                    # Execute request and check internal success (True if request happened)
-                    # _execute_request_step now handles onFailure logic internally
-                    step_executed = await self._execute_request_step(
-                        step=step_instance,
-                        session=session,
-                        base_headers=base_headers,
-                        flow_headers=current_flow_headers_substituted, # Pass substituted global headers
-                        context=context
-                    )
-                    # If step failed internally (e.g., bad URL param) or stopped due to onFailure=stop,
-                    # flow_error should be set in the context.
-                    # The check at the start of the *next* loop iteration will handle sequence halting.
-                    if not step_executed:
-                         logger.warning(f"{indent}User {user_id_log}: Request step {step_identifier} failed internal execution checks. Flow error should be set.")
-                         # Rely on the check at the top of the loop to halt if needed.
-
-                # --- Condition Step ---
-                elif isinstance(step_instance, ConditionStep):
-                    condition_data_model = step_instance.conditionData # Might be None
-                    condition_result = self._evaluate_condition(
-                        condition_str=step_instance.condition, # Legacy string (optional)
-                        context=context,
-                        condition_data=condition_data_model # Structured data (preferred)
-                    )
-
-                    # Log evaluation result
-                    cond_desc = "N/A"
-                    if condition_data_model and condition_data_model.variable:
-                        cond_desc = f"'{condition_data_model.variable}' {condition_data_model.operator} '{condition_data_model.value}'"
-                    elif step_instance.condition:
-                        cond_desc = f"Legacy: '{step_instance.condition}'"
-                    logger.info(f"{indent}User {user_id_log}: Condition {step_identifier}: {cond_desc} -> {condition_result}")
-
-                    branch_to_execute_data = step_instance.then if condition_result else step_instance.else_
-                    branch_name = "then" if condition_result else "else"
-
-                    # branch_to_execute_data might be a list of dicts or models here
-                    if branch_to_execute_data: # Ensure list is not empty
-                        logger.debug(f"{indent}User {user_id_log}: Executing '{branch_name}' branch for {step_identifier} ({len(branch_to_execute_data)} steps)...")
-                        # Recurse: Pass the list (containing dicts/models), original flow_headers, context, increased depth
-                        await self._execute_steps(branch_to_execute_data, session, base_headers, flow_headers, context, depth + 1)
-                        # Error propagation: If the sub-sequence set flow_error, the check at the top of the next loop iteration will catch it.
-                    else:
-                        logger.debug(f"{indent}User {user_id_log}: No steps found in '{branch_name}' branch for {step_identifier}.")
-
-                # --- Loop Step ---
-                elif isinstance(step_instance, LoopStep):
-                    await self._execute_loop_step(
-                        step_instance,
-                        session,
-                        base_headers,
-                        flow_headers,
-                        context,
-                        depth,
-                        user_id_log,
-                    )
-
-                else: # Should be unreachable with validated models
+                # One dict lookup on the concrete model type instead of an isinstance chain
+                dispatch = self._STEP_DISPATCH.get(type(step_instance))
+                if dispatch is None: # Should be unreachable with validated models
                     logger.error(f"{indent}User {user_id_log}: Encountered unknown step instance type '{type(step_instance).__name__}' for {step_identifier}. Halting sequence.")
                     set_value_in_context(context, 'flow_error', f"Unknown step type {type(step_instance).__name__}")
                     return # Stop sequence
+                await dispatch(
+                    self, step_instance, session, base_headers, flow_headers,
+                    current_flow_headers_substituted, context, depth, user_id_log, step_identifier,
+                )
 
             except asyncio.CancelledError:
                 logger.info(f"{indent}User {user_id_log}: Step execution cancelled during step {step_identifier}.")
@@ -1991,9 +2479,8 @@ class FlowRunner:
                 raise # Propagate cancellation upwards
 
             except Exception as e:
+                # exc_info already carries the traceback in debug mode
                 logger.error(f"{indent}User {user_id_log}: Unhandled error processing step {step_identifier}: {e}", exc_info=self.config.debug)
-                if self.config.debug and not isinstance(e, asyncio.CancelledError): # Don't print traceback for cancellation
-                    traceback.print_exc()
                 # Set flow error to halt further execution in this sequence
                 set_value_in_context(context, 'flow_error', f"Error in step {step_identifier}: {e}")
                 logger.error(f"{indent}User {user_id_log}: Halting flow sequence due to error.")
@@ -2002,12 +2489,14 @@ class FlowRunner:
             finally:
                 step_end_time = time.monotonic()
                 step_duration = step_end_time - step_start_time
-                logger.debug(f"{indent}User {user_id_log}: Finished Step {step_identifier} ({i+1}/{total_steps}) in {step_duration:.3f} seconds.")
+                if _DEBUG:
+                    logger.debug(f"{indent}User {user_id_log}: Finished Step {step_identifier} ({i+1}/{total_steps}) in {step_duration:.3f} seconds.")
 
 
         sequence_end_time = time.monotonic()
         sequence_duration = sequence_end_time - sequence_start_time
-        logger.debug(f"{indent}User {user_id_log}: Finished executing sequence of {total_steps} steps in {sequence_duration:.3f} seconds.")
+        if _DEBUG:
+            logger.debug(f"{indent}User {user_id_log}: Finished executing sequence of {total_steps} steps in {sequence_duration:.3f} seconds.")
 
 
     async def simulate_user_lifecycle(self, user_id: int):
@@ -2017,6 +2506,7 @@ class FlowRunner:
         """
         user_log_prefix = f"User {user_id}"
         connector = None # Initialize connector reference
+        owns_connector = False # Only close connectors this task created itself
         flow_iteration = 0
 
         try: # Top-level try/finally for reliable active user count decrement
@@ -2026,27 +2516,27 @@ class FlowRunner:
             flow_name_log = getattr(self.flowmap, 'name', 'N/A')
             logger.info(f"{user_log_prefix}: Task started for flow '{flow_name_log}'. Active users: {self._active_users_count}")
 
-            # Create connector once for the lifetime of this user task (allows connection pooling)
-            connector = self.create_aiohttp_connector()
+            # Use the run-wide shared connector; fall back to a task-owned one when
+            # the lifecycle is driven directly (outside start_generating)
+            connector = self._shared_connector
+            if connector is None:
+                connector = self.create_aiohttp_connector()
+                owns_connector = True
 
             # --- Main Loop ---
             while self.running:
                 flow_iteration += 1
+                _sync_debug_flag() # Pick up level changes made outside configure_logging
                 flow_instance_start_time = time.monotonic()
                 flow_epoch_start_time = time.time()  # Wall clock time
 
                 # --- Generate Per-Flow State ---
                 fake_ip = self.generate_random_ip()
-                is_web_like = random.choice([True, False])
-                # Ensure random.choice returns a dict before calling .copy()
-                chosen_headers_template = random.choice(self.headers_web_options if is_web_like else self.headers_api_options)
-                if not isinstance(chosen_headers_template, dict):
-                    logger.error(f"{user_log_prefix} (Iter {flow_iteration}): Invalid header template found: {chosen_headers_template}. Using empty headers.")
-                    base_session_headers = {}
-                else:
-                    base_session_headers = chosen_headers_template.copy()
+                is_web_like = random.random() < 0.5 # Coin flip without building a list per iteration
+                # Profiles are read-only mappings; take a mutable shallow copy for this iteration
+                base_session_headers = dict(random.choice(self.headers_web_options if is_web_like else self.headers_api_options))
 
-                chosen_ua_template = random.choice(self.user_agents_web if is_web_like else self.user_agents_api)
+                chosen_ua_template = self._next_user_agent(is_web_like)
                 if not isinstance(chosen_ua_template, str):
                      logger.error(f"{user_log_prefix} (Iter {flow_iteration}): Invalid user agent template found: {chosen_ua_template}. Using default UA.")
                      ua = "FlowRunner/1.0" # Default fallback UA
@@ -2056,7 +2546,8 @@ class FlowRunner:
 
                 if self.config.xff_header_name:
                     base_session_headers[self.config.xff_header_name] = fake_ip
-                logger.debug(f"{user_log_prefix} (Iter {flow_iteration}): New session state (IP: {fake_ip}, UA: {ua[:30]}..., Profile: {'Web' if is_web_like else 'API'})")
+                if _DEBUG:
+                    logger.debug(f"{user_log_prefix} (Iter {flow_iteration}): New session state (IP: {fake_ip}, UA: {ua[:30]}..., Profile: {'Web' if is_web_like else 'API'})")
 
                 # --- Initialize Context for this Flow Instance ---
                 context = {
@@ -2066,10 +2557,10 @@ class FlowRunner:
                     "flowStartTimeEpoch": flow_epoch_start_time,
                     "flow_error": None # Initialize error state explicitly
                 }
-                # Add static variables (use deepcopy for isolation)
+                # Add static variables (deep copied for isolation)
                 static_vars = getattr(self.flowmap, 'staticVars', {})
                 if static_vars:
-                    try: context.update(copy.deepcopy(static_vars))
+                    try: context.update(_fast_copy(static_vars))
                     except Exception as copy_err:
                          logger.warning(f"{user_log_prefix} (Iter {flow_iteration}): Could not deepcopy staticVars: {copy_err}. Using shallow copy.")
                          context.update(static_vars)
@@ -2078,9 +2569,10 @@ class FlowRunner:
                 global_flow_headers_def = getattr(self.flowmap, 'headers', {}) or {}
 
                 if self.on_iteration_start and flow_iteration > 1:
-                    logger.debug(
-                        f"Calling on_iteration_start callback for iteration {flow_iteration} with context keys: {list(context.keys())}"
-                    )
+                    if _DEBUG:
+                        logger.debug(
+                            f"Calling on_iteration_start callback for iteration {flow_iteration} with context keys: {list(context.keys())}"
+                        )
                     try:
                         self.on_iteration_start(flow_iteration, context)
                     except Exception as cb_err:
@@ -2106,7 +2598,7 @@ class FlowRunner:
                     )
 
                     # Check final error state in context
-                    final_flow_error_val = get_value_from_context(context, 'flow_error')
+                    final_flow_error_val = get_value_from_context(context, 'flow_error', _FLOW_ERROR_PATH)
                     if final_flow_error_val is _MISSING or final_flow_error_val is None:
                         flow_completed_successfully = True
                     else:
@@ -2127,7 +2619,8 @@ class FlowRunner:
                     # --- Cleanup Session for this Iteration ---
                     if session and not session.closed:
                         await session.close()
-                        logger.debug(f"{user_log_prefix} (Iter {flow_iteration}): Session closed.")
+                        if _DEBUG:
+                            logger.debug(f"{user_log_prefix} (Iter {flow_iteration}): Session closed.")
 
                     # --- Record Metrics and Log Duration ---
                     flow_instance_end_time = time.monotonic()
@@ -2150,8 +2643,8 @@ class FlowRunner:
                         if hasattr(self, '_stopped_event') and self._stopped_event and not self._stopped_event.is_set():
                             self._stopped_event.set()
                         break
-                    if self.config.flow_cycle_delay_ms is not None:
-                        rest_duration_s = max(self.config.flow_cycle_delay_ms / 1000.0, 0.001)
+                    if self._cycle_delay_s is not None:
+                        rest_duration_s = self._cycle_delay_s
                     else:
                         min_rest_s = self.config.min_sleep_ms / 1000.0
                         max_rest_s = self.config.max_sleep_ms / 1000.0
@@ -2192,8 +2685,8 @@ class FlowRunner:
                 else:
                     logger.warning(f"{user_log_prefix}: Task exiting, but active user count was already {self._active_users_count}.")
 
-            # --- Cleanup Connector ---
-            if connector and not connector.closed:
+            # --- Cleanup Connector (shared connector is closed by stop_generating) ---
+            if owns_connector and connector and not connector.closed:
                 logger.debug(f"{user_log_prefix}: Closing user task connector.")
                 try:
                     # Use timeout for connector closing to prevent hangs
@@ -2203,7 +2696,7 @@ class FlowRunner:
                      logger.warning(f"{user_log_prefix}: Timeout closing user task connector.")
                 except Exception as conn_close_err:
                      logger.error(f"{user_log_prefix}: Error closing user task connector: {conn_close_err}")
-            elif connector:
+            elif owns_connector and connector:
                  logger.debug(f"{user_log_prefix}: Connector was already closed.")
 
             logger.info(f"{user_log_prefix}: Task finished cleanup. Final active users: {self._active_users_count}")
@@ -9,6 +9,7 @@ from __future__ import annotations
 import asyncio
 import threading
 import logging
+import time
 from typing import Any, Dict, Optional
 
 from app_adapter import ApplicationAdapter
@@ -16,6 +17,54 @@ from flow_runner import FlowRunner, FlowMap, ContainerConfig, Metrics, StartRequ
 
 logger = logging.getLogger("flowrunner_adapter")
 
+# Both /api/metrics and /metrics read the same snapshot; refresh it at most this often.
+METRICS_SNAPSHOT_TTL_S = 1.0
+# How often the runner loop publishes RPS/average duration for the adapter to read.
+METRICS_SAMPLE_INTERVAL_S = 1.0
+
+# Prometheus exposition for the adapter's metrics. HELP/TYPE lines are static;
+# only the values are filled in per scrape, printf-style in a single pass. %s
+# renders exactly as str() did in the original per-line f-strings.
+_PROM_TEMPLATE = (
+    "# HELP flowrunner_running Whether FlowRunner is currently running\n"
+    "# TYPE flowrunner_running gauge\n"
+    "flowrunner_running %(running)d\n"
+    "# HELP flowrunner_requests_per_second Current requests per second\n"
+    "# TYPE flowrunner_requests_per_second gauge\n"
+    "flowrunner_requests_per_second %(rps)s\n"
+    "# HELP flowrunner_total_requests_total Total number of requests made\n"
+    "# TYPE flowrunner_total_requests_total counter\n"
+    "flowrunner_total_requests_total %(total_requests)s\n"
+    "# HELP flowrunner_flows_completed_total Total number of flows completed\n"
+    "# TYPE flowrunner_flows_completed_total counter\n"
+    "flowrunner_flows_completed_total %(flow_count)s\n"
+    "# HELP flowrunner_avg_flow_duration_milliseconds Average flow duration in milliseconds\n"
+    "# TYPE flowrunner_avg_flow_duration_milliseconds gauge\n"
+    "flowrunner_avg_flow_duration_milliseconds %(avg_ms)s\n"
+    "# HELP flowrunner_active_users Number of active simulated users\n"
+    "# TYPE flowrunner_active_users gauge\n"
+    "flowrunner_active_users %(active_users)s"
+)
+
+# Values reported before the first start, matching an idle runner.
+_IDLE_FLOW_RUNNER_METRICS: Dict[str, Any] = {
+    "running": False,
+    "rps": 0.0,
+    "total_requests": 0,
+    "flow_count": 0,
+    "avg_flow_duration_ms": 0.0,
+    "active_users": 0,
+}
+
+
+async def _fetch_runner_metrics(metrics: Metrics) -> tuple[Any, Any]:
+    """Read RPS and average flow duration in one hop onto the runner loop."""
+    return tuple(await asyncio.gather(
+        metrics.get_rps(),
+        metrics.get_average_flow_duration_ms(),
+        return_exceptions=True,
+    ))
+
 
 class FlowRunnerAdapter(ApplicationAdapter):
     """
@@ -35,6 +84,13 @@ class FlowRunnerAdapter(ApplicationAdapter):
         self.background_thread: Optional[threading.Thread] = None
         self.metrics: Optional[Metrics] = None
         self._shutdown_event = threading.Event()
+        # Loop-side twin of _shutdown_event, created on the runner loop.
+        self._stop_requested: Optional[asyncio.Event] = None
+        self._metrics_snapshot: Optional[Dict[str, Any]] = None
+        self._metrics_snapshot_time = 0.0
+        self._metrics_snapshot_lock = threading.Lock()
+        # Latest (rps, avg_flow_duration_ms) published by the runner loop's sampler.
+        self._runner_values: tuple[float, float] = (0.0, 0.0)
 
     def start(self, start_payload: Dict[str, Any], *, ensure_user) -> Any:
         """
@@ -67,6 +123,8 @@ class FlowRunnerAdapter(ApplicationAdapter):
             
             # Create metrics instance
             self.metrics = Metrics()
+            self._runner_values = (0.0, 0.0)
+            self._invalidate_metrics_snapshot()
             
             # Start FlowRunner in background thread
             self._shutdown_event.clear()
@@ -91,19 +149,15 @@ class FlowRunnerAdapter(ApplicationAdapter):
         # Signal shutdown
         self._shutdown_event.set()
         
-        # Stop the flow runner if it exists
-        if self.flow_runner and self.event_loop:
+        # Wake the runner loop; its lifecycle coroutine stops the FlowRunner itself
+        loop = self.event_loop
+        stop_requested = self._stop_requested
+        if loop is not None and stop_requested is not None:
             try:
-                if self.event_loop.is_running():
-                    # Schedule the stop coroutine in the event loop
-                    future = asyncio.run_coroutine_threadsafe(
-                        self.flow_runner.stop_generating(),
-                        self.event_loop
-                    )
-                    # Wait for completion with timeout
-                    future.result(timeout=10.0)
-            except Exception as e:
-                logger.warning(f"Error during FlowRunner stop: {e}")
+                loop.call_soon_threadsafe(stop_requested.set)
+            except RuntimeError as e:
+                # Loop already closed - the thread is finishing on its own
+                logger.debug(f"Runner loop not accepting callbacks: {e}")
         
         # Wait for background thread to finish
         if self.background_thread and self.background_thread.is_alive():
@@ -115,6 +169,8 @@ class FlowRunnerAdapter(ApplicationAdapter):
         self.flow_runner = None
         self.event_loop = None
         self.background_thread = None
+        self._stop_requested = None
+        self._invalidate_metrics_snapshot()
         
         logger.info("FlowRunner stopped")
 
@@ -128,64 +184,75 @@ class FlowRunnerAdapter(ApplicationAdapter):
         return False
 
     def get_metrics(self) -> Dict[str, Any]:
-        """Return current FlowRunner metrics."""
-        if not self.metrics:
+        """
+        Return current FlowRunner metrics.
+
+        The values come from a snapshot shared by the JSON and Prometheus endpoints
+        and refreshed at most once per METRICS_SNAPSHOT_TTL_S, so concurrent
+        scrapers do not each recompute it. Each caller gets its own copy, so
+        mutating the result does not leak into the next scrape.
+        """
+        snapshot = self._get_metrics_snapshot()
+        if snapshot is None:
             return {}
-        
+        return {"flow_runner": dict(snapshot["flow_runner"])}
+
+    def _get_metrics_snapshot(self) -> Optional[Dict[str, Any]]:
+        """Return the shared snapshot (rebuilt once stale), or None when there are no metrics. Read-only."""
+        if not self.metrics:
+            return None
+
+        now = time.monotonic()
+        with self._metrics_snapshot_lock:
+            if (
+                self._metrics_snapshot is None
+                or now - self._metrics_snapshot_time >= METRICS_SNAPSHOT_TTL_S
+            ):
+                self._metrics_snapshot = self._collect_metrics()
+                self._metrics_snapshot_time = now
+            return self._metrics_snapshot
+
+    def _collect_metrics(self) -> Dict[str, Any]:
+        """Build a fresh metrics snapshot from the running FlowRunner."""
         try:
-            # Get metrics synchronously (the metrics methods are not async)
+            rps, avg_ms = self._runner_values
+            flow_runner = self.flow_runner
+            metrics = self.metrics
             return {
                 "flow_runner": {
-                    "running": self.flow_runner is not None and getattr(self.flow_runner, 'running', False),
-                    "rps": self.metrics.last_rps_value,
-                    "total_requests": len(self.metrics.request_timestamps),
-                    "flow_count": self.metrics.flow_count,
-                    "avg_flow_duration_ms": (
-                        self.metrics.flow_duration_sum / self.metrics.flow_count * 1000
-                        if self.metrics.flow_count > 0 else 0
-                    ),
-                    "active_users": getattr(self.flow_runner, '_active_users_count', 0) if self.flow_runner else 0,
+                    "running": flow_runner is not None and flow_runner.running,
+                    "rps": rps,
+                    "total_requests": metrics.total_requests,
+                    "flow_count": metrics.flow_count,
+                    "avg_flow_duration_ms": avg_ms,
+                    "active_users": flow_runner._active_users_count if flow_runner is not None else 0,
                 }
             }
         except Exception as e:
             logger.warning(f"Error collecting metrics: {e}")
             return {"flow_runner": {"error": str(e)}}
 
+    def _invalidate_metrics_snapshot(self) -> None:
+        """Force the next get_metrics() call to rebuild the snapshot."""
+        with self._metrics_snapshot_lock:
+            self._metrics_snapshot = None
+
     def prometheus_metrics(self) -> list[str]:
         """Return Prometheus-formatted metrics."""
-        metrics = self.get_metrics().get("flow_runner", {})
+        snapshot = self._get_metrics_snapshot()
+        metrics = snapshot["flow_runner"] if snapshot else _IDLE_FLOW_RUNNER_METRICS
         
         if "error" in metrics:
             return []
         
-        lines = []
-        
-        # Add Prometheus metrics
-        lines.append("# HELP flowrunner_running Whether FlowRunner is currently running")
-        lines.append("# TYPE flowrunner_running gauge")
-        lines.append(f"flowrunner_running {int(metrics.get('running', False))}")
-        
-        lines.append("# HELP flowrunner_requests_per_second Current requests per second")
-        lines.append("# TYPE flowrunner_requests_per_second gauge")
-        lines.append(f"flowrunner_requests_per_second {metrics.get('rps', 0)}")
-        
-        lines.append("# HELP flowrunner_total_requests_total Total number of requests made")
-        lines.append("# TYPE flowrunner_total_requests_total counter")
-        lines.append(f"flowrunner_total_requests_total {metrics.get('total_requests', 0)}")
-        
-        lines.append("# HELP flowrunner_flows_completed_total Total number of flows completed")
-        lines.append("# TYPE flowrunner_flows_completed_total counter")
-        lines.append(f"flowrunner_flows_completed_total {metrics.get('flow_count', 0)}")
-        
-        lines.append("# HELP flowrunner_avg_flow_duration_milliseconds Average flow duration in milliseconds")
-        lines.append("# TYPE flowrunner_avg_flow_duration_milliseconds gauge")
-        lines.append(f"flowrunner_avg_flow_duration_milliseconds {metrics.get('avg_flow_duration_ms', 0)}")
-        
-        lines.append("# HELP flowrunner_active_users Number of active simulated users")
-        lines.append("# TYPE flowrunner_active_users gauge")
-        lines.append(f"flowrunner_active_users {metrics.get('active_users', 0)}")
-        
-        return lines
+        return (_PROM_TEMPLATE % {
+            "running": metrics["running"],
+            "rps": metrics["rps"],
+            "total_requests": metrics["total_requests"],
+            "flow_count": metrics["flow_count"],
+            "avg_ms": metrics["avg_flow_duration_ms"],
+            "active_users": metrics["active_users"],
+        }).split("\n")
 
     def _run_flow_runner_in_thread(self, start_request: StartRequest) -> None:
         """
@@ -193,6 +260,7 @@ class FlowRunnerAdapter(ApplicationAdapter):
         """
         logger.info("Starting FlowRunner background thread")
         
+        main_task: Optional[asyncio.Task] = None
         try:
             # Create new event loop for this thread
             self.event_loop = asyncio.new_event_loop()
@@ -206,7 +274,8 @@ class FlowRunnerAdapter(ApplicationAdapter):
             )
             
             # Run until shutdown is requested
-            self.event_loop.run_until_complete(self._run_flow_runner_lifecycle())
+            main_task = self.event_loop.create_task(self._run_flow_runner_lifecycle())
+            self.event_loop.run_until_complete(main_task)
             
         except asyncio.CancelledError:
             logger.info("FlowRunner background thread cancelled")
@@ -216,14 +285,12 @@ class FlowRunnerAdapter(ApplicationAdapter):
             # Clean up event loop
             if self.event_loop:
                 try:
-                    # Cancel any remaining tasks
-                    pending = asyncio.all_tasks(self.event_loop)
-                    for task in pending:
-                        task.cancel()
-                    
-                    if pending:
+                    # Only the lifecycle task needs cancelling: it owns the user
+                    # tasks and stops them via stop_generating() on the way out.
+                    if main_task is not None and not main_task.done():
+                        main_task.cancel()
                         self.event_loop.run_until_complete(
-                            asyncio.gather(*pending, return_exceptions=True)
+                            asyncio.gather(main_task, return_exceptions=True)
                         )
                     
                     self.event_loop.close()
@@ -232,17 +299,41 @@ class FlowRunnerAdapter(ApplicationAdapter):
             
             logger.info("FlowRunner background thread finished")
 
+    async def _sample_runner_metrics(self) -> None:
+        """
+        Publish RPS and average flow duration at a fixed rate so metrics readers
+        on other threads only ever touch a plain attribute.
+        """
+        while True:
+            rps, avg_ms = await _fetch_runner_metrics(self.metrics)
+            # Normalise types here once so snapshot readers never need to cast
+            self._runner_values = (
+                0.0 if isinstance(rps, BaseException) else float(rps),
+                0.0 if isinstance(avg_ms, BaseException) else float(avg_ms),
+            )
+            await asyncio.sleep(METRICS_SAMPLE_INTERVAL_S)
+
     async def _run_flow_runner_lifecycle(self) -> None:
         """
         Manage the FlowRunner lifecycle within the async event loop.
         """
+        self._stop_requested = asyncio.Event()
+        # stop() may have run before the event existed; then never start generating,
+        # as stop_generating() on a runner that has not started yet is a no-op.
+        if self._shutdown_event.is_set():
+            logger.info("Shutdown requested before FlowRunner generation started")
+            return
+        # start_generating() only returns once the runner is stopped, so run it
+        # alongside the stop signal rather than before it.
+        generating = asyncio.create_task(self.flow_runner.start_generating())
+        sampler = asyncio.create_task(self._sample_runner_metrics())
         try:
             logger.info("Starting FlowRunner generation")
-            await self.flow_runner.start_generating()
             
-            # Wait for shutdown signal
-            while not self._shutdown_event.is_set():
-                await asyncio.sleep(0.1)
+            # Wait for shutdown signal (set via call_soon_threadsafe by stop())
+            stop_wait = asyncio.create_task(self._stop_requested.wait())
+            await asyncio.wait({generating, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            stop_wait.cancel()
             
             logger.info("Shutdown signal received, stopping FlowRunner")
             
@@ -254,6 +345,8 @@ class FlowRunnerAdapter(ApplicationAdapter):
                     await self.flow_runner.stop_generating()
                 except Exception as e:
                     logger.warning(f"Error stopping FlowRunner: {e}")
+            sampler.cancel()
+            await asyncio.gather(generating, sampler, return_exceptions=True)
 
     def pre_start_hooks(self, start_payload: Dict[str, Any]) -> None:
         """Optional hook called before starting FlowRunner."""
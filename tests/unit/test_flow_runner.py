@@ -38,12 +38,16 @@ del sys.modules["pydantic"]
 sys.modules["pydantic"] = importlib.import_module("pydantic")
 import asyncio
 from typing import Any, Dict
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 import logging
 import aiohttp
 import copy
+import json
+import math
+import time
+from urllib.parse import urlparse
 
 from flow_runner import (
     FlowRunner,
@@ -55,6 +59,8 @@ from flow_runner import (
     ConditionData,
     Metrics,
     get_value_from_context, _MISSING, set_value_in_context,
+    _compile_path, _fast_copy, _compile_template, _CachedUTCFormatter,
+    _json_dumps_bytes, _json_loads, StaticResolver,
 )
 
 
@@ -70,13 +76,32 @@ def empty_flow() -> FlowMap:
 
 def make_runner(config: ContainerConfig, flow: FlowMap) -> FlowRunner:
     metrics = Metrics()
-    metrics.increment = AsyncMock()
+    metrics.increment = MagicMock()
     metrics.record_flow_duration = AsyncMock()
     runner = FlowRunner(config, flow, metrics)
     runner.metrics = metrics
     return runner
 
 
+@pytest.mark.asyncio
+async def test_metrics_rps_window_and_total(monkeypatch):
+    import flow_runner
+    clock = [100.0]
+    monkeypatch.setattr(flow_runner.time, "monotonic", lambda: clock[0])
+    metrics = Metrics()
+
+    for _ in range(3):
+        metrics.increment()
+    clock[0] = 100.55
+    metrics.increment()
+    clock[0] = 100.6
+    assert await metrics.get_rps() == 4.0
+
+    clock[0] = 101.2  # first three requests fell out of the 1s window
+    assert await metrics.get_rps() == 1.0
+    assert metrics.total_requests == 4
+
+
 def test_flowmap_accepts_numeric_id():
     fm = FlowMap(id=12345, name="test", steps=[], staticVars={})
     assert fm.id == 12345
@@ -142,6 +167,8 @@ def test_extract_data_non_dict_body(base_config, empty_flow):
     [
         ("equals", 5, "5", True),
         ("not_equals", 5, "6", True),
+        ("equals", True, "TRUE", True),
+        ("not_equals", 2.5, "2.5", False),
         ("greater_than", 5, "4", True),
         ("less_than", 5, "6", True),
         ("contains", ["a", "b"], "a", True),
@@ -151,6 +178,8 @@ def test_extract_data_non_dict_body(base_config, empty_flow):
         ("exists", "x", "", True),
         ("not_exists", None, "", True),
         ("is_number", 3, "", True),
+        ("is_number", True, "", False),
+        ("is_number", float("nan"), "", False),
         ("is_text", "t", "", True),
         ("is_boolean", True, "", True),
         ("is_array", [1], "", True),
@@ -186,6 +215,28 @@ async def test_evaluate_structured_condition_edge_cases(base_config, empty_flow,
     data_bool = ConditionData(variable="val", operator="is_true", value="")
     assert runner._evaluate_structured_condition(data_bool, ctx_bool) is False
 
+    data_unknown = ConditionData(variable="val", operator="is_object", value="")
+    with caplog.at_level(logging.WARNING, logger="FlowRunner"):
+        assert runner._evaluate_structured_condition(data_unknown, ctx_bool) is False
+    assert "Unknown structured condition operator" in caplog.text
+
+
+def test_condition_data_precomputes_operands():
+    data = ConditionData(variable=" val ", operator=" equals ", value="2.5")
+    assert data._variable_path == "val"
+    assert data._operator == "equals"
+    assert data._operator is sys.intern("equals")
+    assert data._numeric_value == 2.5
+    assert data._bool_value is None
+
+    data_bool = ConditionData(variable="v", operator="equals", value="TRUE")
+    assert data_bool._bool_value is True
+    assert data_bool._numeric_value is None
+
+    data_null = ConditionData(variable="v", operator="equals", value=None)
+    assert data_null._value_str == ""
+    assert data_null._value_is_null is True
+
 
 @pytest.mark.asyncio
 async def test_execute_loop_step_iterates_and_isolates_context(monkeypatch, base_config, empty_flow):
@@ -239,6 +290,77 @@ async def test_execute_request_step_url_override(empty_flow):
     assert session2.request.call_args.args[1] == "http://other.com/path"
 
 
+@pytest.mark.asyncio
+async def test_execute_request_step_missing_trailing_url_param(empty_flow):
+    cfg = ContainerConfig(flow_target_url="http://base.com", sim_users=1, override_step_url_host=False)
+    runner = make_runner(cfg, empty_flow)
+    session = MagicMock()
+
+    step = RequestStep(id="s1", type="request", method="GET", url="/users/{{uid}}/", onFailure="continue")
+    assert step._trailing_url_param == "uid"
+    assert RequestStep(id="s2", type="request", method="GET", url="/{{uid}}/items", onFailure="continue")._trailing_url_param is None
+
+    context: Dict[str, Any] = {"uid": ""}
+    assert await runner._execute_request_step(step, session, {}, {}, context) is False
+    session.request.assert_not_called()
+    assert context["response_s1_status"] == 599
+
+
+@pytest.mark.asyncio
+async def test_execute_request_step_header_precedence(empty_flow):
+    cfg = ContainerConfig(flow_target_url="http://base.com", sim_users=1)
+    runner = make_runner(cfg, empty_flow)
+    resp = AsyncMock()
+    resp.status = 200
+    resp.headers = {"Content-Type": "text/plain"}
+    resp.text = AsyncMock(return_value="ok")
+    session = MagicMock()
+    cm = AsyncMock()
+    cm.__aenter__.return_value = resp
+    session.request.return_value = cm
+
+    base = {"A": "base", "B": "base"}
+    step = RequestStep(id="s1", type="request", method="GET", url="/p", headers={"C": "step"}, onFailure="continue")
+    await runner._execute_request_step(step, session, base, {"B": "flow", "C": "flow"}, {})
+    assert session.request.call_args.kwargs["headers"] == {"A": "base", "B": "flow", "C": "step"}
+    assert base == {"A": "base", "B": "base"}
+
+
+@pytest.mark.asyncio
+async def test_execute_request_step_static_and_templated_bodies(empty_flow):
+    cfg = ContainerConfig(flow_target_url="http://base.com", sim_users=1)
+    runner = make_runner(cfg, empty_flow)
+
+    resp = AsyncMock()
+    resp.status = 200
+    resp.headers = {"Content-Type": "text/plain"}
+    resp.text = AsyncMock(return_value="ok")
+    session = MagicMock()
+    cm = AsyncMock()
+    cm.__aenter__.return_value = resp
+    session.request.return_value = cm
+
+    static_step = RequestStep(id="s1", type="request", method="POST", url="/p", body={"a": 1}, onFailure="continue")
+    assert static_step._url_needs_substitution is False
+    assert static_step._parsed_url.path == "/p"
+    await runner._execute_request_step(static_step, session, {}, {}, {})
+    kwargs = session.request.call_args.kwargs
+    assert json.loads(kwargs["data"]) == {"a": 1}
+    assert kwargs["json"] is None
+    assert kwargs["headers"]["Content-Type"] == "application/json; charset=utf-8"
+
+    templated_step = RequestStep(id="s2", type="request", method="POST", url="/p", body={"a": "{{v}}"}, onFailure="continue")
+    await runner._execute_request_step(templated_step, session, {}, {}, {"v": "x"})
+    assert session.request.call_args.kwargs["json"] == {"a": "x"}
+
+
+def test_request_step_parses_only_literal_urls_at_validation():
+    literal = RequestStep(id="s1", type="request", method="GET", url="http://h.com/a?b=1", onFailure="continue")
+    assert literal._parsed_url == urlparse("http://h.com/a?b=1")
+    templated = RequestStep(id="s2", type="request", method="GET", url="/users/{{id}}", onFailure="continue")
+    assert templated._parsed_url is None
+
+
 @pytest.mark.asyncio
 async def test_execute_request_step_url_override_preserves_query_and_fragment(empty_flow):
     cfg = ContainerConfig(flow_target_url="http://base.com", sim_users=1)
@@ -284,6 +406,14 @@ async def test_execute_request_step_query_param_plus_encoding(empty_flow):
     called_url = session.request.call_args.args[1]
     assert called_url == "http://base.com/p?query=value%20with%2Bplus"
 
+    ctx = {"val": "plain-1.0"}
+    await runner._execute_request_step(step, session, {}, {}, ctx)
+    assert session.request.call_args.args[1] == "http://base.com/p?query=plain-1.0"
+
+    bare_step = RequestStep(id="s2", type="request", method="GET", url="/p?flag&x=1", onFailure="continue")
+    await runner._execute_request_step(bare_step, session, {}, {}, {})
+    assert session.request.call_args.args[1] == "http://base.com/p?flag=&x=1"
+
 
 @pytest.mark.asyncio
 async def test_execute_request_step_dns_override_host_header(empty_flow):
@@ -398,7 +528,7 @@ async def test_execute_request_step_retries_server_error(monkeypatch, empty_flow
     step = RequestStep(id="s1", type="request", method="GET", url="/a", onFailure="continue")
     await runner._execute_request_step(step, session, {}, {}, {})
     assert session.request.call_count == 2
-    assert runner.metrics.increment.await_count == 1
+    assert runner.metrics.increment.call_count == 1
 
 
 @pytest.mark.asyncio
@@ -422,7 +552,7 @@ async def test_execute_request_step_retries_connection_error(monkeypatch, empty_
     step = RequestStep(id="s1", type="request", method="GET", url="/a", onFailure="continue")
     await runner._execute_request_step(step, session, {}, {}, {})
     assert session.request.call_count == 2
-    assert runner.metrics.increment.await_count == 1
+    assert runner.metrics.increment.call_count == 1
 
 
 @pytest.mark.asyncio
@@ -437,7 +567,27 @@ async def test_execute_request_step_metrics_not_incremented_on_failure(monkeypat
 
     step = RequestStep(id="s1", type="request", method="GET", url="/a", onFailure="continue")
     await runner._execute_request_step(step, session, {}, {}, {})
-    assert runner.metrics.increment.await_count == 0
+    assert runner.metrics.increment.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_execute_steps_validates_dict_step_once(monkeypatch, base_config, empty_flow):
+    runner = make_runner(base_config, empty_flow)
+    runner.running = True
+    step_dict = {"id": "r1", "type": "request", "method": "get", "url": "/x", "onFailure": "continue"}
+
+    seen = []
+    async def fake_request_step(step, session, base_headers, flow_headers, context):
+        seen.append(step)
+        return True
+    monkeypatch.setattr(runner, "_execute_request_step", fake_request_step)
+
+    for _ in range(2):
+        await runner._execute_steps([step_dict], MagicMock(), {}, {}, {"userId": 1})
+
+    assert len(seen) == 2
+    assert isinstance(seen[0], RequestStep) and seen[0].method == "GET"
+    assert seen[0] is seen[1]
 
 
 @pytest.mark.asyncio
@@ -607,6 +757,75 @@ async def test_start_and_stop_generating_updates_active_count(monkeypatch, base_
     assert runner.get_active_user_count() == 0
 
 
+@pytest.mark.asyncio
+async def test_stop_generating_logs_task_errors(monkeypatch, base_config, empty_flow, caplog):
+    runner = make_runner(base_config, empty_flow)
+    monkeypatch.setattr(runner, "create_aiohttp_connector", lambda: MagicMock(closed=False, close=AsyncMock()))
+
+    async def failing_user(user_id):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            raise ValueError("cleanup failed")
+
+    monkeypatch.setattr(runner, "simulate_user_lifecycle", failing_user)
+    task = asyncio.create_task(runner.start_generating())
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    with caplog.at_level(logging.ERROR, logger="FlowRunner"):
+        await runner.stop_generating()
+    await task
+    assert runner.user_tasks == []
+    assert "unexpected error during stop: cleanup failed" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_run_once_stop_closes_shared_connector(monkeypatch, empty_flow):
+    cfg = ContainerConfig(flow_target_url="http://example.com", sim_users=1)
+    runner = FlowRunner(cfg, empty_flow, Metrics(), run_once=True)
+    connector = aiohttp.TCPConnector()
+    monkeypatch.setattr(runner, "create_aiohttp_connector", lambda: connector)
+    monkeypatch.setattr(runner, "create_session", lambda conn: MagicMock(closed=False, close=AsyncMock()))
+    monkeypatch.setattr(runner, "_execute_steps", AsyncMock())
+
+    # The run_once user clears running and sets the stop event itself
+    await asyncio.wait_for(runner.start_generating(), timeout=5.0)
+    assert runner.running is False
+    await runner.stop_generating()
+
+    assert connector.closed
+    assert runner._shared_connector is None
+
+
+@pytest.mark.asyncio
+async def test_start_generating_shares_one_connector(monkeypatch, empty_flow):
+    cfg = ContainerConfig(flow_target_url="http://example.com", sim_users=3)
+    runner = make_runner(cfg, empty_flow)
+
+    connector = MagicMock(closed=False, close=AsyncMock())
+    factory = MagicMock(return_value=connector)
+    sessions_for = []
+    monkeypatch.setattr(runner, "create_aiohttp_connector", factory)
+
+    def fake_session(conn):
+        sessions_for.append(conn)
+        return MagicMock(closed=False, close=AsyncMock())
+
+    monkeypatch.setattr(runner, "create_session", fake_session)
+    monkeypatch.setattr(runner, "_execute_steps", AsyncMock())
+
+    task = asyncio.create_task(runner.start_generating())
+    for _ in range(5):
+        await asyncio.sleep(0)
+    await runner.stop_generating()
+    await task
+
+    assert factory.call_count == 1
+    assert sessions_for and all(conn is connector for conn in sessions_for)
+    connector.close.assert_awaited_once()
+    assert runner._shared_connector is None
+
+
 @pytest.mark.asyncio
 async def test_simulate_user_flow_cycle_delay(monkeypatch, empty_flow):
     cfg = ContainerConfig(flow_target_url="http://example.com", sim_users=1, flow_cycle_delay_ms=200)
@@ -713,6 +932,45 @@ def test_get_value_from_context_edge_cases():
     assert get_value_from_context(None, "a") is _MISSING
 
 
+def test_compile_path_tokens_are_cached():
+    tokens = _compile_path("a.b[1].c")
+    assert [(kind, part) for kind, part, _ in tokens] == [
+        ("k", "a"),
+        ("k", "b"),
+        ("i", 1),
+        ("k", "c"),
+    ]
+    assert _compile_path("a.b[1].c") is tokens
+
+
+def test_fast_copy_isolates_nested_containers():
+    original = {"a": [1, {"b": "x"}], "t": (1, [2]), "n": None}
+    copied = _fast_copy(original)
+    assert copied == original
+    copied["a"][1]["b"] = "y"
+    copied["t"][1].append(3)
+    assert original["a"][1]["b"] == "x"
+    assert original["t"] == (1, [2])
+
+
+def test_compile_template_segments():
+    assert _compile_template("no placeholders") is None
+    assert _compile_template("/a/{{ id }}") is None  # spaces are not allowed
+    assert _compile_template("/a/{{id}}/b?q={{q.x[0]}}") == (
+        ("/a/", "id", _compile_path("id")),
+        ("/b?q=", "q.x[0]", _compile_path("q.x[0]")),
+        ("", None, None),
+    )
+
+
+def test_request_step_validation_warms_template_cache():
+    RequestStep(id="w", type="request", method="GET", url="/warm/{{wid}}", headers={"X-W": "{{wh}}"}, onFailure="stop")
+    misses = _compile_template.cache_info().misses
+    _compile_template("/warm/{{wid}}")
+    _compile_template("{{wh}}")
+    assert _compile_template.cache_info().misses == misses
+
+
 def test_set_value_in_context_nested_creation():
     ctx: Dict[str, Any] = {}
     set_value_in_context(ctx, "x.y.z", 5)
@@ -747,3 +1005,147 @@ def test_substitute_variables_unquoted_and_malformed(base_config, empty_flow):
         runner._substitute_variables("##VAR:unquoted:name:extra##", context)
         is None
     )
+
+
+def test_cached_utc_formatter_matches_stdlib_gmtime_output():
+    reference = logging.Formatter("%(asctime)sZ %(message)s")
+    reference.converter = time.gmtime
+    cached = _CachedUTCFormatter("%(asctime)sZ %(message)s")
+    for created in (1700000000.123, 1700000000.987, 1700000001.5):
+        record = logging.LogRecord("FlowRunner", logging.INFO, __file__, 1, "msg", None, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        assert cached.format(record) == reference.format(record)
+
+
+def test_json_codec_helpers_handle_values_outside_orjson_range():
+    assert json.loads(_json_dumps_bytes({"a": [1, "é"]})) == {"a": [1, "é"]}
+    assert json.loads(_json_dumps_bytes({"big": 2 ** 70})) == {"big": 2 ** 70}
+    assert _json_loads(b'{"x": 1}') == {"x": 1}
+    assert math.isnan(_json_loads(b"NaN"))
+
+
+def test_json_dumps_bytes_non_finite_floats():
+    # Compact orjson output; NaN/Infinity are sent as null
+    assert _json_dumps_bytes({"v": float("nan"), "w": float("inf")}) == b'{"v":null,"w":null}'
+
+
+def test_step_and_path_keys_are_interned():
+    header = "".join(["X-", "Trace"])
+    step = RequestStep(id="s", type="request", method="post", url="/p", headers={header: "1"}, onFailure="stop")
+    assert next(iter(step.headers)) is sys.intern("X-Trace")
+    assert step.method is sys.intern("POST")
+    assert step._status_key is sys.intern("response_s_status")
+    assert step._error_key == "response_s_error"
+    kind, part, _ = _compile_path("".join(["user", ".", "name"]))[1]
+    assert part is sys.intern("name")
+
+
+def test_step_sleeps_drawn_in_batches_within_bounds(empty_flow):
+    import flow_runner
+    cfg = ContainerConfig(flow_target_url="http://example.com", sim_users=1, min_sleep_ms=5, max_sleep_ms=9)
+    runner = make_runner(cfg, empty_flow)
+    draws = [runner._next_step_sleep_s() for _ in range(flow_runner._STEP_SLEEP_BATCH + 1)]
+    assert all(0.005 <= d <= 0.009 for d in draws)
+    assert runner._step_sleep_index == 1
+
+
+@pytest.mark.asyncio
+async def test_dns_override_connector_uses_static_resolver(empty_flow):
+    cfg = ContainerConfig(flow_target_url="https://example.com:8443", sim_users=1, flow_target_dns_override="10.0.0.5")
+    runner = make_runner(cfg, empty_flow)
+    connector = runner.create_aiohttp_connector()
+    try:
+        resolver = connector._resolver
+        assert isinstance(resolver, StaticResolver)
+        [result] = await resolver.resolve("example.com", 8443)
+        assert result["host"] == "10.0.0.5"
+        assert result["port"] == 8443
+    finally:
+        await connector.close()
+
+
+def test_configure_logging_toggles_debug_flag(base_config, empty_flow):
+    import flow_runner
+    runner = make_runner(base_config, empty_flow)
+    try:
+        runner.configure_logging(True)
+        assert flow_runner._DEBUG is True
+    finally:
+        runner.configure_logging(False)
+    assert flow_runner._DEBUG is False
+
+
+@pytest.mark.asyncio
+async def test_debug_flag_follows_host_set_level(monkeypatch, empty_flow):
+    import flow_runner
+    cfg = ContainerConfig(flow_target_url="http://example.com", sim_users=1)
+    runner = FlowRunner(cfg, empty_flow, Metrics(), run_once=True)
+    monkeypatch.setattr(runner, "create_aiohttp_connector", lambda: MagicMock(closed=False, close=AsyncMock()))
+    monkeypatch.setattr(runner, "create_session", lambda conn: MagicMock(closed=False, close=AsyncMock()))
+    monkeypatch.setattr(runner, "_execute_steps", AsyncMock())
+    assert flow_runner._DEBUG is False
+    try:
+        logging.getLogger("FlowRunner").setLevel(logging.DEBUG) # Host bypasses configure_logging
+        await asyncio.wait_for(runner.start_generating(), timeout=5.0)
+        assert flow_runner._DEBUG is True
+    finally:
+        runner.configure_logging(False)
+        await runner.stop_generating()
+    assert flow_runner._DEBUG is False
+
+
+def test_configure_logging_skips_unchanged_level(base_config, empty_flow):
+    runner = make_runner(base_config, empty_flow)
+    runner.configure_logging(False)
+    with patch.object(logging.Handler, "setLevel") as set_level:
+        runner.configure_logging(False)
+    set_level.assert_not_called()
+
+
+def test_override_netloc_precomputed(empty_flow):
+    cfg = ContainerConfig(flow_target_url="https://example.com:8443", sim_users=1, flow_target_dns_override="::1")
+    runner = make_runner(cfg, empty_flow)
+    assert runner._override_port == 8443
+    assert runner._override_netloc == "[::1]:8443"
+
+    cfg_default = ContainerConfig(flow_target_url="http://example.com", sim_users=1, flow_target_dns_override="10.0.0.1")
+    runner_default = make_runner(cfg_default, empty_flow)
+    assert runner_default._override_port == 80
+    assert runner_default._override_netloc == "10.0.0.1"
+
+
+def test_substitute_variables_shares_template_free_subtrees(base_config, empty_flow):
+    runner = make_runner(base_config, empty_flow)
+    static = {"a": [1, {"b": "c"}], "d": "e"}
+    assert runner._substitute_variables(static, {}) is static
+
+    mixed = {"static": {"x": [1, 2]}, "dyn": "{{v}}"}
+    result = runner._substitute_variables(mixed, {"v": "V"})
+    assert result == {"static": {"x": [1, 2]}, "dyn": "V"}
+    assert result["static"] is mixed["static"]
+
+
+def test_var_tokens_parsed_once_at_load():
+    import flow_runner
+    RequestStep(id="t", type="request", method="POST", url="/t", body={"n": "##VAR:unquoted:load.count##"}, onFailure="stop")
+    misses = flow_runner._parse_var_token.cache_info().misses
+    assert flow_runner._parse_var_token("##VAR:unquoted:load.count##") == ("unquoted", "load.count", flow_runner._compile_path("load.count"))
+    assert flow_runner._parse_var_token.cache_info().misses == misses
+    assert flow_runner._parse_var_token("##VAR:missingpath##") is None
+
+
+def test_request_step_body_renderer(base_config, empty_flow):
+    runner = make_runner(base_config, empty_flow)
+    static = {"fixed": [1, 2]}
+    step = RequestStep(
+        id="t", type="request", method="POST", url="/t", onFailure="stop",
+        body={"n": "##VAR:unquoted:count##", "s": "id-{{user.id}}", "static": static},
+    )
+    assert step._body_renderer is not None
+    body = step._body_renderer(runner._substitute_variables, {"count": 3, "user": {"id": 7}})
+    assert body == {"n": 3, "s": "id-7", "static": static}
+    assert body["static"] is step.body["static"]
+
+    plain = RequestStep(id="p", type="request", method="POST", url="/p", onFailure="stop", body={"a": 1})
+    assert plain._body_renderer is None
@@ -0,0 +1,180 @@
+import sys
+import os
+import types
+import threading
+import asyncio
+sys.modules.setdefault("psutil", types.ModuleType("psutil"))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+# The adapter base class ships with Container Control Core, not with this repo
+app_adapter = types.ModuleType("app_adapter")
+class ApplicationAdapter:
+    def __init__(self, static_cfg=None):
+        self.static_cfg = static_cfg or {}
+setattr(app_adapter, "ApplicationAdapter", ApplicationAdapter)
+sys.modules.setdefault("app_adapter", app_adapter)
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import flowrunner_adapter
+from flowrunner_adapter import FlowRunnerAdapter
+from flow_runner import Metrics, StartRequest
+
+
+def make_start_request() -> StartRequest:
+    return StartRequest.model_validate({
+        "config": {"flow_target_url": "http://example.com", "sim_users": 2},
+        "flowmap": {"name": "test", "steps": []},
+    })
+
+
+def test_stop_before_lifecycle_never_starts_generating():
+    adapter = FlowRunnerAdapter()
+    adapter._shutdown_event.set() # stop() landed before the runner loop got going
+
+    thread = threading.Thread(target=adapter._run_flow_runner_in_thread, args=(make_start_request(),))
+    thread.start()
+    thread.join(timeout=5.0)
+
+    assert not thread.is_alive()
+    assert adapter.flow_runner.running is False
+    assert adapter.flow_runner.user_tasks == []
+
+
+@pytest.mark.asyncio
+async def test_lifecycle_skips_start_when_shutdown_already_set():
+    adapter = FlowRunnerAdapter()
+    adapter.flow_runner = MagicMock(start_generating=AsyncMock(), stop_generating=AsyncMock())
+    adapter._shutdown_event.set()
+
+    await adapter._run_flow_runner_lifecycle()
+
+    adapter.flow_runner.start_generating.assert_not_called()
+
+
+def old_prometheus_lines(metrics):
+    """The per-line f-string rendering the template replaced."""
+    return [
+        "# HELP flowrunner_running Whether FlowRunner is currently running",
+        "# TYPE flowrunner_running gauge",
+        f"flowrunner_running {int(metrics.get('running', False))}",
+        "# HELP flowrunner_requests_per_second Current requests per second",
+        "# TYPE flowrunner_requests_per_second gauge",
+        f"flowrunner_requests_per_second {metrics.get('rps', 0)}",
+        "# HELP flowrunner_total_requests_total Total number of requests made",
+        "# TYPE flowrunner_total_requests_total counter",
+        f"flowrunner_total_requests_total {metrics.get('total_requests', 0)}",
+        "# HELP flowrunner_flows_completed_total Total number of flows completed",
+        "# TYPE flowrunner_flows_completed_total counter",
+        f"flowrunner_flows_completed_total {metrics.get('flow_count', 0)}",
+        "# HELP flowrunner_avg_flow_duration_milliseconds Average flow duration in milliseconds",
+        "# TYPE flowrunner_avg_flow_duration_milliseconds gauge",
+        f"flowrunner_avg_flow_duration_milliseconds {metrics.get('avg_flow_duration_ms', 0)}",
+        "# HELP flowrunner_active_users Number of active simulated users",
+        "# TYPE flowrunner_active_users gauge",
+        f"flowrunner_active_users {metrics.get('active_users', 0)}",
+    ]
+
+
+def make_adapter_with_metrics() -> FlowRunnerAdapter:
+    adapter = FlowRunnerAdapter()
+    adapter.metrics = Metrics()
+    adapter.metrics.total_requests = 12
+    adapter.metrics.flow_count = 3
+    adapter._runner_values = (2.25, 153.125)
+    adapter.flow_runner = MagicMock(running=True, _active_users_count=4)
+    return adapter
+
+
+def test_metrics_snapshot_reused_within_ttl_and_rebuilt_after(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(flowrunner_adapter, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    adapter = make_adapter_with_metrics()
+
+    assert adapter.get_metrics()["flow_runner"]["total_requests"] == 12
+
+    adapter.metrics.total_requests = 20
+    now[0] += flowrunner_adapter.METRICS_SNAPSHOT_TTL_S / 2
+    assert adapter.get_metrics()["flow_runner"]["total_requests"] == 12
+
+    now[0] += flowrunner_adapter.METRICS_SNAPSHOT_TTL_S
+    assert adapter.get_metrics()["flow_runner"]["total_requests"] == 20
+
+
+def test_get_metrics_callers_cannot_mutate_shared_snapshot():
+    adapter = make_adapter_with_metrics()
+    result = adapter.get_metrics()
+    result["flow_runner"]["total_requests"] = -1
+    result["system"] = {"cpu": 1.0}
+
+    assert adapter.get_metrics() == {"flow_runner": {**result["flow_runner"], "total_requests": 12}}
+    assert "flowrunner_total_requests_total 12" in adapter.prometheus_metrics()
+
+
+def test_get_metrics_without_runner_metrics_is_empty():
+    assert FlowRunnerAdapter().get_metrics() == {}
+
+
+def test_prometheus_metrics_idle_fallback():
+    lines = FlowRunnerAdapter().prometheus_metrics()
+    assert lines == old_prometheus_lines(flowrunner_adapter._IDLE_FLOW_RUNNER_METRICS)
+    assert "flowrunner_running 0" in lines
+    assert "flowrunner_requests_per_second 0.0" in lines
+
+
+def test_prometheus_metrics_match_original_formatting():
+    adapter = make_adapter_with_metrics()
+    snapshot = adapter.get_metrics()["flow_runner"]
+    lines = adapter.prometheus_metrics()
+    assert lines == old_prometheus_lines(snapshot)
+    assert "flowrunner_requests_per_second 2.25" in lines
+    assert "flowrunner_avg_flow_duration_milliseconds 153.125" in lines
+
+
+@pytest.mark.asyncio
+async def test_fetch_runner_metrics_returns_errors_and_sampler_zeroes_them():
+    metrics = Metrics()
+    metrics.get_rps = AsyncMock(side_effect=RuntimeError("boom"))
+    metrics.get_average_flow_duration_ms = AsyncMock(return_value=12)
+
+    rps, avg_ms = await flowrunner_adapter._fetch_runner_metrics(metrics)
+    assert isinstance(rps, RuntimeError)
+    assert avg_ms == 12
+
+    adapter = FlowRunnerAdapter()
+    adapter.metrics = metrics
+    adapter._runner_values = (5.0, 5.0)
+    sampler = asyncio.create_task(adapter._sample_runner_metrics())
+    for _ in range(10): # First sample publishes before the sampler's first sleep
+        if adapter._runner_values != (5.0, 5.0):
+            break
+        await asyncio.sleep(0)
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+    assert adapter._runner_values == (0.0, 12.0)
+    assert type(adapter._runner_values[1]) is float
+
+
+@pytest.mark.asyncio
+async def test_lifecycle_cancels_sampler_on_stop():
+    stopped = asyncio.Event()
+
+    async def stop_generating():
+        stopped.set()
+
+    adapter = FlowRunnerAdapter()
+    adapter.metrics = Metrics()
+    adapter.flow_runner = MagicMock(start_generating=stopped.wait, stop_generating=stop_generating)
+
+    lifecycle = asyncio.create_task(adapter._run_flow_runner_lifecycle())
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert adapter._stop_requested is not None
+
+    adapter._stop_requested.set()
+    await asyncio.wait_for(lifecycle, timeout=5.0)
+
+    assert stopped.is_set()
+    assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task()] == []